@@ -1,22 +1,225 @@
 import dash
-from dash import dcc, html, Input, Output, callback_context
+from dash import dcc, html, Input, Output, State, Patch, no_update, callback_context
 import plotly.graph_objs as go
-import threading, time, random
+import threading, time, random, atexit
 import psutil
+import numpy as np
 from scheduler import Scheduler, TaskType
+from engine import SimulationEngine
+from sharding import ShardedScheduler
+from flask import Response
+import instrumentation
+
+# 'threads' runs one real-time worker thread per stage; 'engine' drives the same
+# scheduler from the discrete-event engine paced at wall-clock speed; 'sharded'
+# runs one paced engine process per region of the plane (see SHARD_REGIONS) and
+# the dashboard shows their aggregate
+RUNTIME = 'threads'
+SHARD_REGIONS = (2, 2)
 
 app = dash.Dash(__name__)
-scheduler = Scheduler()
+scheduler = ShardedScheduler(regions=SHARD_REGIONS) if RUNTIME == 'sharded' else Scheduler()
+if RUNTIME == 'sharded':
+    atexit.register(scheduler.close)  # Stops shard processes and frees the shared fleet
 
 # Create 20 riders
 for i in range(1, 21):
     scheduler.add_rider(f"rider_{i}")
 
-# Global thread handles
+# Engine thread handle when RUNTIME == 'engine'
 simulation_thread = None
-trip_matching_thread = None
-payment_thread = None
-feedback_thread = None
+
+# Prometheus scrape endpoint next to the dashboard
+@app.server.route('/metrics')
+def prometheus_metrics():
+    return Response(instrumentation.render(scheduler), mimetype='text/plain; version=0.0.4')
+
+def overload_summary(metrics):
+    return f"Queue full {metrics['queue_full']} · Shed {metrics['shed']} · Dropped {metrics['dropped']}"
+
+def worst_priority_wait(waits):
+    # p99 queue wait of the least urgent priority class seen so far
+    if not waits:
+        return ""
+    priority = max(waits)
+    return f"p99 queue wait (priority {priority}): {waits[priority][99] * 1000:.0f} ms"
+
+# CPU utilisation sampled by a background thread, so no callback blocks on psutil
+cpu_percent = 0.0
+
+def sample_cpu():
+    global cpu_percent
+    while True:
+        cpu_percent = psutil.cpu_percent(interval=1.0)
+
+threading.Thread(target=sample_cpu, name='cpu-sampler', daemon=True).start()
+
+# Full figures, built once per page load or reset; the panel callbacks below
+# then only send Patch updates or extendData points
+
+QUEUE_LABELS = ['Trip Matching', 'Payment', 'Feedback']
+LATENCY_PERCENTILES = ((50, '#027f9e', 'solid'), (95, '#f39c12', 'dash'), (99, '#c0392b', 'dot'))
+
+def queue_figure():
+    return go.Figure(
+        data=[go.Bar(x=QUEUE_LABELS, y=[0, 0, 0],
+                    marker_color=['#e74c3c', '#f1c40f', '#2ecc71'])],
+        layout=go.Layout(
+            plot_bgcolor='white',
+            barmode='group',  # Group the bars together
+            xaxis=dict(
+                title='Task Type',
+                tickmode='array',
+                tickvals=[0, 1, 2],
+                ticktext=QUEUE_LABELS,
+                showgrid=True,  # Show grid
+            ),
+            yaxis=dict(
+                title='Queue Size',
+                range=[0, 1],  # Ensure proper scaling
+                showgrid=True  # Show grid lines for y-axis
+            ),
+            shapes=[  # Add vertical grid lines
+                dict(
+                    type='line',
+                    x0=i, x1=i,
+                    y0=0, y1=1,
+                    line=dict(color='gray', width=2, dash='dot')
+                ) for i in range(len(QUEUE_LABELS))
+            ],
+            margin=dict(l=50, r=50, t=50, b=50),  # Add margin for space
+        )
+    )
+
+def response_figure():
+    # Rolling p50/p95/p99 of trip matching latency; points arrive through extendData
+    return go.Figure(
+        data=[go.Scatter(
+            x=[],
+            y=[],
+            name=f"p{p}",
+            mode='lines+markers',
+            line=dict(color=color, width=2, dash=dash),
+            marker=dict(size=4, color='grey', line=dict(width=0.5, color='black'))
+        ) for p, color, dash in LATENCY_PERCENTILES],
+        layout=go.Layout(
+            xaxis=dict(
+                title='Time (s)',
+                range=[0, None],
+                showgrid=True,  # Enable grid lines
+                gridcolor='lightgray',  # Color for the grid lines
+                tickmode='auto',  # Automatically adjust tick marks
+                ticks='outside',  # Show ticks outside the plot
+                showline=True,  # Show axis line
+                linecolor='black',  # Axis line color
+            ),
+            yaxis=dict(
+                title='Response Time (ms)',
+                range=[0, None],
+                showgrid=True,  # Enable grid lines
+                gridcolor='lightgray',  # Color for the grid lines
+                ticks='outside',  # Show ticks outside the plot
+                showline=True,  # Show axis line
+                linecolor='black',  # Axis line color
+            ),
+            title=dict(text="", font=dict(size=13)),
+            margin=dict(l=50, r=50, t=50, b=50),  # Add margin for space
+            plot_bgcolor='white',
+        )
+    )
+
+def rider_status_figure(fleet):
+    return go.Figure(
+        data=[go.Bar(x=fleet.names, y=[1] * len(fleet.names), marker_color=rider_status_colors(fleet))],
+        layout=go.Layout(
+            xaxis=dict(type='category', title='Rider IDs'),
+            yaxis=dict(visible=False, showticklabels=False),
+            plot_bgcolor='white',
+            margin=dict(l=50, r=50, t=50, b=50)
+        )
+    )
+
+def rider_status_colors(fleet):
+    if len(fleet.available) and not fleet.available.any():
+        return ["red"] * len(fleet.names)
+    return np.where(fleet.available, "gray", "green").tolist()
+
+def feedback_figure():
+    return go.Figure(
+        data=[go.Bar(
+            x=['⭐', '⭐⭐', '⭐⭐⭐', '⭐⭐⭐⭐', '⭐⭐⭐⭐⭐'],
+            y=[0] * 5,
+            marker=dict(
+                color=[0] * 5,  # Color by the count
+                colorscale='Viridis',  # Gradient color scale
+                showscale=False  # Display color scale
+            )
+        )],
+        layout=go.Layout(
+            plot_bgcolor='white',
+            xaxis=dict(title='Feedback Rating'),
+            yaxis=dict(title='Number of Feedbacks'),
+            margin=dict(l=50, r=50, t=50, b=50)
+        )
+    )
+
+def ranking_figure():
+    return go.Figure(
+        data=[go.Bar(
+            x=[],
+            y=[],
+            marker=dict(
+                color=[],  # Color based on rating
+                colorscale="Blues",  # Gradient color effect
+            ),
+            hoverinfo='x+y',
+            text=[],  # Show values on bars
+            textposition="auto",
+            opacity=0.85  # Slight transparency for aesthetics
+        )],
+        layout=go.Layout(
+            plot_bgcolor='white',
+            xaxis=dict(
+                title='Rider IDs',
+                tickmode="linear",
+                showgrid=True,
+            ),
+            yaxis=dict(
+                title='Average Feedback',
+                gridcolor="lightgray",
+                range=[0, None]
+            ),
+            margin=dict(l=50, r=50, t=50, b=50)
+        )
+    )
+
+def details_figure():
+    return go.Figure(
+        data=[
+            go.Scatter(
+                x=[],
+                y=[],
+                mode="markers",
+                marker=dict(
+                    size=[],
+                    color=[],
+                    colorscale="Plasma",  # More visually appealing color gradient
+                    colorbar={"title": "Avg Feedback"},
+                    line=dict(width=1, color="black"),
+                    opacity=0.85,  # Slight transparency for a polished look
+                ),
+                hoverinfo="text",
+                text=[],  # Show details only on hover
+            )
+        ],
+        layout=go.Layout(
+            xaxis=dict(title="X Location", showgrid=False, zeroline=False),
+            yaxis=dict(title="Y Location", showgrid=False, zeroline=False),
+            plot_bgcolor="white",
+            paper_bgcolor="#f7f9fc",  # Soft background for a clean look
+            margin=dict(l=40, r=40, t=20, b=40),
+        ),
+    )
 
 app.layout = html.Div([
     # Header
@@ -83,7 +286,11 @@ app.layout = html.Div([
                         'transition': 'color 0.4s',
                         }),
 
-        dcc.Interval(id='interval', interval=1000)
+        dcc.Interval(id='interval', interval=1000),
+        dcc.Interval(id='fleet-interval', interval=3000),  # Per-rider panels refresh less often
+        dcc.Store(id='reset-store'),
+        dcc.Store(id='series-cursor'),  # Last latency point sent to this page
+        dcc.Store(id='fleet-size', data=len(scheduler.riders))
     ], style={'textAlign': 'center', 'marginTop': '10px'}),
 
 
@@ -95,7 +302,9 @@ app.layout = html.Div([
             html.H3("🏍️ Trip Matched", style={'marginBottom': '5px', 'color': '#27ae60'}),
             html.P(id='throughput', 
                 style={'fontSize': '36px', 'color': '#27ae60', 
-                        'fontWeight': 'bold', 'textAlign': 'center'})
+                        'fontWeight': 'bold', 'textAlign': 'center'}),
+            html.P(id='overload', 
+                style={'fontSize': '14px', 'color': '#7f8c8d', 'textAlign': 'center'})
         ], style={'width': '300px', 'padding': '20px', 'textAlign': 'center', 
                 'borderRadius': '12px', 'boxShadow': '0px 4px 10px rgba(0, 0, 0, 0.1)', 
                 'backgroundColor': '#ecfdf5'}),
@@ -125,14 +334,14 @@ app.layout = html.Div([
     html.Div([
         html.Div([
             html.H3("🧮 Task Queue Status", style={'textAlign': 'center', 'marginBottom': '10px', 'color': '#2c3e50'}),
-            dcc.Graph(id='task-queues', style={'height': '350px'})
+            dcc.Graph(id='task-queues', figure=queue_figure(), style={'height': '350px'})
         ], style={'width': '48%', 'padding': '15px', 'borderRadius': '12px', 
                 'boxShadow': '0px 4px 10px rgba(0, 0, 0, 0.1)', 
                 'backgroundColor': '#ecf0f1', 'textAlign': 'center'}),
         
         html.Div([
             html.H3("⌛ Rider Status Grid", style={'textAlign': 'center', 'marginBottom': '10px', 'color': '#2c3e50'}),
-            dcc.Graph(id='rider-status', style={'height': '350px'})
+            dcc.Graph(id='rider-status', figure=rider_status_figure(scheduler.fleet_snapshot()), style={'height': '350px'})
         ], style={'width': '48%', 'padding': '15px', 'borderRadius': '12px', 
                 'boxShadow': '0px 4px 10px rgba(0, 0, 0, 0.1)', 
                 'backgroundColor': '#ecf0f1', 'textAlign': 'center'})
@@ -145,7 +354,7 @@ app.layout = html.Div([
         html.Div([
             html.H3("🕝 Trip Matching Response Time", 
                     style={'textAlign': 'center', 'marginBottom': '10px', 'color': '#2c3e50'}),
-            dcc.Graph(id='response-times', style={'height': '350px'})
+            dcc.Graph(id='response-times', figure=response_figure(), style={'height': '350px'})
         ], style={'width': '48%', 'padding': '15px', 'borderRadius': '12px', 
                 'boxShadow': '0px 4px 10px rgba(0, 0, 0, 0.1)', 
                 'backgroundColor': '#ecf0f1', 'textAlign': 'center'}),
@@ -153,7 +362,7 @@ app.layout = html.Div([
         html.Div([
             html.H3("🛣️ Rider Details", 
                     style={'textAlign': 'center', 'marginBottom': '10px', 'color': '#2c3e50'}),
-            dcc.Graph(id='rider-details', style={'height': '350px'})
+            dcc.Graph(id='rider-details', figure=details_figure(), style={'height': '350px'})
         ], style={'width': '48%', 'padding': '15px', 'borderRadius': '12px', 
                 'boxShadow': '0px 4px 10px rgba(0, 0, 0, 0.1)', 
                 'backgroundColor': '#ecf0f1', 'textAlign': 'center'})
@@ -166,7 +375,7 @@ app.layout = html.Div([
         html.Div([
             html.H3("📝 Customer Feedback", 
                     style={'textAlign': 'center', 'marginBottom': '10px', 'color': '#2c3e50'}),
-            dcc.Graph(id='customer-feedback', style={'height': '350px'})
+            dcc.Graph(id='customer-feedback', figure=feedback_figure(), style={'height': '350px'})
         ], style={'width': '48%', 'padding': '15px', 'borderRadius': '12px', 
                 'boxShadow': '0px 4px 10px rgba(0, 0, 0, 0.1)', 
                 'backgroundColor': '#ecf0f1', 'textAlign': 'center'}),
@@ -174,7 +383,7 @@ app.layout = html.Div([
         html.Div([
             html.H3("🏆 Rider Feedback Ranking", 
                     style={'textAlign': 'center', 'marginBottom': '10px', 'color': '#2c3e50'}),
-            dcc.Graph(id='rider-ranking', style={'height': '350px'})
+            dcc.Graph(id='rider-ranking', figure=ranking_figure(), style={'height': '350px'})
         ], style={'width': '48%', 'padding': '15px', 'borderRadius': '12px', 
                 'boxShadow': '0px 4px 10px rgba(0, 0, 0, 0.1)', 
                 'backgroundColor': '#ecf0f1', 'textAlign': 'center'})
@@ -218,311 +427,156 @@ app.layout = html.Div([
     })
 ])
 
+def halt_simulation():
+    # Stops the current run and waits until its threads, engine or shard
+    # processes have exited, so nothing is still writing while we reset
+    scheduler.stop(wait=True)
+    if simulation_thread is not None:
+        simulation_thread.join()
+
+def reset_triggered():
+    return any(t['prop_id'].startswith('reset-store') for t in callback_context.triggered)
+
+@app.callback(Output('reset-store', 'data'), Input('reset-btn', 'n_clicks'), prevent_initial_call=True)
+def reset_simulation(reset_clicks):
+    # Runs before the panels, which rebuild their figures when reset-store changes
+    halt_simulation()
+    scheduler.reset()
+    return reset_clicks
+
 @app.callback(
-    [Output('task-queues', 'figure'),
-     Output('response-times', 'figure'),
-     Output('rider-status', 'figure'),
-     Output('customer-feedback', 'figure'),
-     Output('rider-ranking', 'figure'),
-     Output('rider-details', 'figure'),
-     Output('throughput', 'children'),
+    [Output('throughput', 'children'),
+     Output('overload', 'children'),
      Output('total-trips', 'children'),
-     Output('cpu-util', 'children'),
-     Output('log-display', 'children')],
+     Output('cpu-util', 'children')],
     [Input('interval', 'n_intervals'),
-     Input('reset-btn', 'n_clicks')]
+     Input('reset-store', 'data')]
 )
-def update_gui(n_intervals, reset_clicks):
-    ctx = callback_context
-    triggered = ctx.triggered[0]['prop_id'] if ctx.triggered else ''
-
-    if "reset-btn" in triggered:
-        scheduler.running = False
-        scheduler.reset()
-
-        # Reset Figures
-        queue_fig = go.Figure(
-            data=[go.Bar(x=['Trip Matching', 'Payment', 'Feedback'], y=[0, 0, 0],
-                        marker_color=['#e74c3c', '#f1c40f', '#2ecc71'])],
-            layout=go.Layout(
-                plot_bgcolor='white',
-                barmode='group',  # Group the bars together
-                xaxis=dict(
-                    title='Task Type',
-                    tickmode='array',
-                    tickvals=[0, 1, 2],
-                    ticktext=['Trip Matching', 'Payment', 'Feedback'],
-                    showgrid=True,  # Show grid
-                ),
-                yaxis=dict(
-                    title='Queue Size',
-                    range=[0, None],  # Ensure proper scaling
-                    showgrid=True  # Show grid lines for y-axis
-                ),
-                shapes=[  # Add vertical grid lines
-                    dict(
-                        type='line',
-                        line=dict(color='gray', width=2, dash='dot')
-                    )
-                ],
-                margin=dict(l=50, r=50, t=50, b=50),  # Add margin for space
-            )
-        )
-        
-        resp_fig = go.Figure(
-            data=[go.Scatter(
-                y=[rt * 1000 for rt in scheduler.metrics['trip_response_times']], 
-                mode='lines+markers', 
-                line=dict(color='#027f9e', width=2, dash='solid'),
-                marker=dict(size=6, color='grey', line=dict(width=0.5, color='black'))
-            )],
-            layout=go.Layout(
-                xaxis=dict(
-                    title='Time Interval',
-                    range=[0, None],
-                    showgrid=True,  # Enable grid lines
-                    gridcolor='lightgray',  # Color for the grid lines
-                    tickmode='auto',  # Automatically adjust tick marks
-                    ticks='outside',  # Show ticks outside the plot
-                    #ticklen=6,  # Length of the ticks
-                    showline=True,  # Show axis line
-                    linecolor='black',  # Axis line color
-                ),
-                yaxis=dict(
-                    title='Response Time (ms)',
-                    range=[0, None],
-                    showgrid=True,  # Enable grid lines
-                    gridcolor='lightgray',  # Color for the grid lines
-                    #dtick=10,  # Set grid step to 100ms
-                    ticks='outside',  # Show ticks outside the plot
-                    #ticklen=6,  # Length of the ticks
-                    showline=True,  # Show axis line
-                    linecolor='black',  # Axis line color
-                ),
-                margin=dict(l=50, r=50, t=50, b=50),  # Add margin for space
-                plot_bgcolor='white',
-            )
-        )
-        rider_fig = go.Figure(
-            data=[go.Bar(x=list(scheduler.riders.keys()), y=[1]*len(scheduler.riders),
-                         marker_color=['gray']*len(scheduler.riders))],
-            layout=go.Layout(
-                xaxis=dict(type='category', title='Rider IDs'),
-                yaxis=dict(visible=False, showticklabels=False),
-                plot_bgcolor='white',
-                margin=dict(l=50, r=50, t=50, b=50)
-            )
-        )
-        
-        feedback_fig = go.Figure(layout=go.Layout(plot_bgcolor='white'))
-        ranking_fig = go.Figure(layout=go.Layout(plot_bgcolor='white'))
-        details_fig = go.Figure(layout=go.Layout(plot_bgcolor='white'))
-        return (queue_fig, resp_fig, rider_fig, feedback_fig, ranking_fig, details_fig,
-                "0", "0", "0.0%", "Simulation reset.")
-
-    # Task Queue Sizes (Bar Chart)
-    queue_data = {
-        'Trip Matching': scheduler.queues[TaskType.TRIP_MATCHING].qsize(),
-        'Payment': scheduler.queues[TaskType.PAYMENT].qsize(),
-        'Feedback': scheduler.queues[TaskType.FEEDBACK].qsize()
-    }
-    queue_fig = go.Figure(
-        data=[go.Bar(x=list(queue_data.keys()), y=list(queue_data.values()),
-                    marker_color=['#e74c3c', '#f1c40f', '#2ecc71'])],
-        layout=go.Layout(
-            plot_bgcolor='white',
-            barmode='group',  # Group the bars together
-            xaxis=dict(
-                title='Task Type',
-                tickmode='array',
-                tickvals=[0, 1, 2],
-                ticktext=['Trip Matching', 'Payment', 'Feedback'],
-                showgrid=True,  # Show grid
-            ),
-            yaxis=dict(
-                title='Queue Size',
-                range=[0, max(queue_data.values()) + 1],  # Ensure proper scaling
-                showgrid=True  # Show grid lines for y-axis
-            ),
-            shapes=[  # Add vertical grid lines
-                dict(
-                    type='line',
-                    x0=i, x1=i,
-                    y0=0, y1=max(queue_data.values()) + 1,
-                    line=dict(color='gray', width=2, dash='dot')
-                ) for i in range(len(queue_data))
-            ],
-            margin=dict(l=50, r=50, t=50, b=50),  # Add margin for space
-        )
-    )
+def update_counters(n_intervals, reset_data):
+    metrics = scheduler.snapshot().metrics
+    cpu_util_display = f"{cpu_percent:.1f}%" if scheduler.running else "0.0%"
+    return (str(metrics['throughput']), overload_summary(metrics), str(metrics['completed_trips']),
+            cpu_util_display)
 
-    # Trip Matching Response Times (Line Plot)
-    resp_fig = go.Figure(
-        data=[go.Scatter(
-            y=[rt * 1000 for rt in scheduler.metrics['trip_response_times']], 
-            mode='lines+markers', 
-            line=dict(color='#027f9e', width=2, dash='solid'),
-            marker=dict(size=6, color='grey', line=dict(width=0.5, color='black'))
-        )],
-        layout=go.Layout(
-            xaxis=dict(
-                title='Time Interval',
-                range=[0, None],
-                showgrid=True,  # Enable grid lines
-                gridcolor='lightgray',  # Color for the grid lines
-                tickmode='auto',  # Automatically adjust tick marks
-                ticks='outside',  # Show ticks outside the plot
-                #ticklen=6,  # Length of the ticks
-                showline=True,  # Show axis line
-                linecolor='black',  # Axis line color
-            ),
-            yaxis=dict(
-                title='Response Time (ms)',
-                range=[0, None],
-                showgrid=True,  # Enable grid lines
-                gridcolor='lightgray',  # Color for the grid lines
-                #dtick=10,  # Set grid step to 100ms
-                ticks='outside',  # Show ticks outside the plot
-                #ticklen=6,  # Length of the ticks
-                showline=True,  # Show axis line
-                linecolor='black',  # Axis line color
-            ),
-            #hovermode='closest',  # Make hover display closest point
-            margin=dict(l=50, r=50, t=50, b=50),  # Add margin for space
-            #title_x=0.5,  # Center the title
-            #title_y=0.5,  # Place the title at the top
-            plot_bgcolor='white',
-            #showlegend=False  # Disable legend as it's not needed
-        )
-    )
+@app.callback(
+    Output('task-queues', 'figure'),
+    [Input('interval', 'n_intervals'),
+     Input('reset-store', 'data')]
+)
+def update_queues(n_intervals, reset_data):
+    if reset_triggered():
+        return queue_figure()
+    depths = scheduler.snapshot().queue_depths
+    values = [depths[TaskType.TRIP_MATCHING], depths[TaskType.PAYMENT], depths[TaskType.FEEDBACK]]
+    top = max(values) + 1
+    patched = Patch()
+    patched['data'][0]['y'] = values
+    patched['layout']['yaxis']['range'] = [0, top]
+    for i in range(len(values)):
+        patched['layout']['shapes'][i]['y1'] = top
+    return patched
 
+@app.callback(
+    [Output('response-times', 'extendData'),
+     Output('response-times', 'figure'),
+     Output('series-cursor', 'data')],
+    [Input('interval', 'n_intervals'),
+     Input('reset-store', 'data')],
+    State('series-cursor', 'data')
+)
+def update_response_times(n_intervals, reset_data, cursor):
+    # Sends only the latency points this page has not seen yet; the whole
+    # (bounded) series only after a reset or reload
+    snapshot = scheduler.snapshot()
+    series = snapshot.match_series
+    title = worst_priority_wait(snapshot.queue_waits)
+    restarted = bool(series) and bool(cursor) and series[-1][0] < cursor['last']
+    if reset_triggered() or restarted or not cursor:
+        cursor = {'origin': series[0][0] if series else None, 'last': series[-1][0] if series else float('-inf')}
+        figure = response_figure()
+        for trace, (p, _, _) in zip(figure.data, LATENCY_PERCENTILES):
+            trace.x = [t - cursor['origin'] for t, _ in series]
+            trace.y = [values[p] * 1000 for _, values in series]
+        figure.layout.title.text = title
+        return no_update, figure, cursor
+    patched = Patch()
+    patched['layout']['title']['text'] = title
+    new = [(t, values) for t, values in series if t > cursor['last']]
+    if not new:
+        return no_update, patched, cursor
+    if cursor['origin'] is None:
+        cursor['origin'] = new[0][0]
+    cursor['last'] = new[-1][0]
+    xs = [t - cursor['origin'] for t, _ in new]
+    points = {'x': [xs] * len(LATENCY_PERCENTILES),
+              'y': [[values[p] * 1000 for _, values in new] for p, _, _ in LATENCY_PERCENTILES]}
+    return ([points, list(range(len(LATENCY_PERCENTILES))), scheduler.latency.series_length],
+            patched, cursor)
 
-    # Rider Status Grid (Colored Bar Chart)
-    rider_ids = list(scheduler.riders.keys())
-    rect_values = [1] * len(rider_ids)
-    colors = []
-    for rider in scheduler.riders.values():
-        colors.append("gray" if rider['status'] == 'available' else "green")
-    if not any(rider['status'] == 'available' for rider in scheduler.riders.values()):
-        colors = ["red"] * len(colors)
-    rider_fig = go.Figure(
-        data=[go.Bar(x=rider_ids, y=rect_values, marker_color=colors)],
-        layout=go.Layout(
-            xaxis=dict(type='category', title='Rider IDs'),
-            yaxis=dict(visible=False, showticklabels=False),
-            plot_bgcolor='white',
-            margin=dict(l=50, r=50, t=50, b=50)
-        )
-    )
+@app.callback(
+    Output('customer-feedback', 'figure'),
+    [Input('fleet-interval', 'n_intervals'),
+     Input('reset-store', 'data')]
+)
+def update_feedback(n_intervals, reset_data):
+    if reset_triggered():
+        return feedback_figure()
+    feedback_counts = list(scheduler.snapshot().rating_counts)
+    patched = Patch()
+    patched['data'][0]['y'] = feedback_counts
+    patched['data'][0]['marker']['color'] = feedback_counts
+    return patched
 
-    # Customer Feedback Distribution (Bar Chart)
-    feedback_counts = [sum(1 for r in scheduler.riders.values() for f in r['feedback'] if f == i) 
-                       for i in range(1, 6)]
-    feedback_fig = go.Figure(
-        data=[go.Bar(
-            x=['⭐', '⭐⭐', '⭐⭐⭐', '⭐⭐⭐⭐', '⭐⭐⭐⭐⭐'],
-            y=feedback_counts,
-            marker=dict(
-                color=feedback_counts,  # Color by the count
-                colorscale='Viridis',  # Gradient color scale
-                showscale=False  # Display color scale
-            )
-        )],
-        layout=go.Layout(
-            plot_bgcolor='white',
-            xaxis=dict(title='Feedback Rating'),
-            yaxis=dict(title='Number of Feedbacks'),
-            
-            margin=dict(l=50, r=50, t=50, b=50)
-        )
-    )
+@app.callback(
+    [Output('rider-status', 'figure'),
+     Output('rider-ranking', 'figure'),
+     Output('rider-details', 'figure'),
+     Output('fleet-size', 'data')],
+    [Input('fleet-interval', 'n_intervals'),
+     Input('reset-store', 'data')],
+    State('fleet-size', 'data')
+)
+def update_fleet(n_intervals, reset_data, fleet_size):
+    # Per-rider panels refresh on the slower fleet interval
+    fleet = scheduler.fleet_snapshot()
+    rider_count = len(fleet.names)
+    if reset_triggered() or fleet_size != rider_count:
+        status_fig = rider_status_figure(fleet)
+    else:
+        status_fig = Patch()
+        status_fig['data'][0]['marker']['color'] = rider_status_colors(fleet)
 
     # Rider Ranking (Bar Chart with Ratings)
-    rider_avg = [(rid, (sum(r['feedback']) / len(r['feedback'])) if r['feedback'] else 0) 
-                 for rid, r in scheduler.riders.items()]
-    rider_avg.sort(key=lambda x: x[1], reverse=True)
-    ranking_fig = go.Figure(
-        data=[go.Bar(
-            x=[rid for rid, _ in rider_avg],
-            y=[avg for _, avg in rider_avg],
-            marker=dict(
-                color=[avg for _, avg in rider_avg],  # Color based on rating
-                colorscale="Blues",  # Gradient color effect
-                #showscale=True  # Show color scale
-            ),
-            hoverinfo='x+y',
-            text=[f"{avg:.1f}" for _, avg in rider_avg],  # Show values on bars
-            textposition="auto",
-            opacity=0.85  # Slight transparency for aesthetics
-        )],
-        layout=go.Layout(
-            plot_bgcolor='white',
-            xaxis=dict(
-                title='Rider IDs',
-                tickmode="linear",
-                showgrid=True,
-            ),
-            yaxis=dict(
-                title='Average Feedback',
-                gridcolor="lightgray",
-                range=[0, None]
-            ),
-            margin=dict(l=50, r=50, t=50, b=50)
-        )
-    )
+    ratings = fleet.ratings
+    order = np.argsort(-ratings, kind='stable')
+    ranking_fig = ranking_figure() if reset_triggered() else Patch()
+    ranking_fig['data'][0]['x'] = [fleet.names[i] for i in order.tolist()]
+    ranking_fig['data'][0]['y'] = ratings[order].tolist()
+    ranking_fig['data'][0]['marker']['color'] = ratings[order].tolist()
+    ranking_fig['data'][0]['text'] = [f"{avg:.1f}" for avg in ratings[order].tolist()]
 
     # Rider Details Visualization (Scatter Plot with Marker Size)
-    xs, ys, sizes, avg_feedbacks, hover_texts = [], [], [], [], []
-    for rid, rider in scheduler.riders.items():
-        loc = rider["location"]
-        xs.append(loc[0])
-        ys.append(loc[1])
-        sizes.append(10 + rider["trips_completed"] * 2)  # Adjusting size dynamically
-        avg_fb = sum(rider["feedback"]) / len(rider["feedback"]) if rider["feedback"] else 0
-        avg_feedbacks.append(avg_fb)
-        
-        # Hover details
-        hover_texts.append(
-            f"🆔 Rider: {rid}<br>🚕 Trips: {rider['trips_completed']}<br>⭐ Avg Feedback: {avg_fb:.1f}"
-        )
-    details_fig = go.Figure(
-        data=[
-            go.Scatter(
-                x=xs,
-                y=ys,
-                mode="markers",
-                marker=dict(
-                    size=sizes,
-                    color=avg_feedbacks,
-                    colorscale="Plasma",  # More visually appealing color gradient
-                    colorbar={"title": "Avg Feedback"},
-                    line=dict(width=1, color="black"),
-                    opacity=0.85,  # Slight transparency for a polished look
-                ),
-                hoverinfo="text",
-                text=hover_texts,  # Show details only on hover
-            )
-        ],
-        layout=go.Layout(
-            xaxis=dict(title="X Location", showgrid=False, zeroline=False),
-            yaxis=dict(title="Y Location", showgrid=False, zeroline=False),
-            plot_bgcolor="white",
-            paper_bgcolor="#f7f9fc",  # Soft background for a clean look
-            margin=dict(l=40, r=40, t=20, b=40),
-        ),
-    )
-
-    # CPU Utilization (Percentage Display)
-    cpu_util_display = f"{psutil.cpu_percent(interval=0.1):.1f}%" if scheduler.running else "0.0%"
+    trips = fleet.trips
+    details_fig = details_figure() if reset_triggered() else Patch()
+    details_fig['data'][0]['x'] = fleet.x.tolist()
+    details_fig['data'][0]['y'] = fleet.y.tolist()
+    details_fig['data'][0]['marker']['size'] = (10 + trips * 2).tolist()  # Adjusting size dynamically
+    details_fig['data'][0]['marker']['color'] = ratings.tolist()
+    details_fig['data'][0]['text'] = [
+        f"🆔 Rider: {rid}<br>🚕 Trips: {trip_count}<br>⭐ Avg Feedback: {avg_fb:.1f}"
+        for rid, trip_count, avg_fb in zip(fleet.names, trips.tolist(), ratings.tolist())
+    ]
+    return status_fig, ranking_fig, details_fig, rider_count
 
-    # Logs Display (Text Display)
-    logs_display = "\n".join(scheduler.logs[-100:])  # Show last 100 messages
-
-    return (queue_fig, resp_fig, rider_fig, feedback_fig, ranking_fig, details_fig,
-            str(scheduler.metrics['throughput']),
-            str(scheduler.metrics['completed_trips']),
-            cpu_util_display,
-            logs_display)
+@app.callback(
+    Output('log-display', 'children'),
+    [Input('interval', 'n_intervals'),
+     Input('reset-store', 'data')]
+)
+def update_logs(n_intervals, reset_data):
+    if reset_triggered():
+        return "Simulation reset."
+    return "\n".join(scheduler.events.lines(100))  # Show last 100 messages
 
 @app.callback(
     [Output('start-btn', 'disabled'),
@@ -535,23 +589,21 @@ def control_simulation(start_clicks, stop_clicks):
     if not ctx.triggered:
         return False, True
     button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-    global simulation_thread, trip_matching_thread, payment_thread, feedback_thread
+    global simulation_thread
     if button_id == 'start-btn':
         if not scheduler.running:
+            halt_simulation()
             scheduler.reset()
-            scheduler.running = True
-            # Start threads for simulation
-            trip_matching_thread = threading.Thread(target=scheduler.process_trip_matching_tasks)
-            payment_thread = threading.Thread(target=scheduler.process_payment_tasks)
-            feedback_thread = threading.Thread(target=scheduler.process_feedback_tasks)
-            simulation_thread = threading.Thread(target=scheduler.simulate_task_arrivals)
-            trip_matching_thread.start()
-            payment_thread.start()
-            feedback_thread.start()
-            simulation_thread.start()
+            if RUNTIME == 'engine':
+                scheduler.running = True
+                simulation_thread = threading.Thread(target=SimulationEngine(scheduler, speed=1.0).run)
+                simulation_thread.start()
+            else:
+                # Start stage workers and the arrival generator
+                scheduler.start()
         return True, False
     elif button_id == 'stop-btn':
-        scheduler.running = False
+        scheduler.stop()
         return False, True
     return False, True
 
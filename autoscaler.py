@@ -0,0 +1,69 @@
+import math
+from collections import deque
+
+
+class Autoscaler:
+    # Resizes each stage's worker pool from its queue depth and measured
+    # per-item service time. A stage asks for enough workers to drain its
+    # backlog within `autoscale_target_drain` seconds; the change is applied
+    # only after the same direction has been seen for several consecutive
+    # checks and the stage is out of its cooldown, so short bursts don't flap.
+    def __init__(self, scheduler, max_decisions=1000):
+        self.scheduler = scheduler
+        self.decisions = deque(maxlen=max_decisions)
+        self.reset()
+
+    def reset(self):
+        self.decisions.clear()
+        self._streak = {task_type: 0 for task_type in self.scheduler.queues}  # +n wants up, -n wants down
+        self._last_change = {task_type: float('-inf') for task_type in self.scheduler.queues}
+
+    def desired_workers(self, task_type, depth, service_time):
+        config = self.scheduler.config
+        wanted = math.ceil(depth * service_time / config['autoscale_target_drain'])
+        return max(config['autoscale_min_workers'], min(config['autoscale_max_workers'], wanted))
+
+    def step(self):
+        scheduler = self.scheduler
+        config = scheduler.config
+        now = scheduler.runtime.time()
+        for task_type, task_queue in scheduler.queues.items():
+            depth = task_queue.qsize()
+            service_time = scheduler.service_times[task_type] or scheduler._service_time(task_type)
+            current = scheduler.worker_targets[task_type]
+            desired = self.desired_workers(task_type, depth, service_time)
+
+            if desired > current:
+                self._streak[task_type] = max(self._streak[task_type], 0) + 1
+                ready = self._streak[task_type] >= config['autoscale_up_checks']
+                target = desired
+            elif desired < current:
+                self._streak[task_type] = min(self._streak[task_type], 0) - 1
+                ready = -self._streak[task_type] >= config['autoscale_down_checks']
+                target = current - 1  # Shrink one worker at a time
+            else:
+                self._streak[task_type] = 0
+                continue
+
+            if not ready or now - self._last_change[task_type] < config['autoscale_cooldown']:
+                continue
+            scheduler.set_workers(task_type, target)
+            self._streak[task_type] = 0
+            self._last_change[task_type] = now
+            self.decisions.append({
+                'time': now,
+                'task_type': task_type.name,
+                'queue_depth': depth,
+                'service_time': service_time,
+                'from_workers': current,
+                'to_workers': target
+            })
+            scheduler.events.emit('scaled_up' if target > current else 'scaled_down', now,
+                                  value=depth, detail=f"{task_type.name} workers {current} → {target}")
+
+    def run(self, stopped):
+        # Threaded control loop until `stopped` is set; the simulation engine
+        # calls step() on its own clock instead
+        while self.scheduler.running and not stopped.is_set():
+            self.step()
+            stopped.wait(self.scheduler.config['autoscale_interval'])
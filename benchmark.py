@@ -0,0 +1,190 @@
+import argparse, csv, json, sys, threading, time
+import numpy as np
+import psutil
+from scheduler import Scheduler
+from engine import SimulationEngine
+from latency import STAGES
+import seeding
+
+# Headless benchmarks at three levels:
+#   micro    - _get_best_rider and _calculate_distance per call, swept over fleet size
+#   pipeline - matches per virtual second, engine events per wall second and
+#              stage latency percentiles under the simulation engine, over
+#              rider/customer ratios and arrival rates
+#   soak     - a threaded run sampling RSS and thread count over time
+# `run` writes JSON (and optionally CSV); `compare` flags regressions against
+# a stored baseline and exits non-zero when it finds any.
+
+FLEET_SIZES = (20, 1000, 10_000, 100_000, 1_000_000)
+RIDER_RATIOS = (0.25, 1.0, 4.0)      # Riders per customer
+ARRIVAL_RATES = (2.0, 10.0, 50.0)    # Trip requests/s
+PERCENTILES = (50, 95, 99)
+# Pipeline scenarios take no service time and staff payment and feedback for
+# the highest arrival rate, so the fleet and the matcher set the match rate
+# rather than a saturated stage queue
+PIPELINE_CONFIG = {'matching_service_time': 0.0, 'payment_service_time': 0.0, 'feedback_service_time': 0.0,
+                   'payment_workers': 128, 'feedback_workers': 128}
+
+
+def result(level, name, metric, value, unit, higher_is_better, **params):
+    return {'level': level, 'name': name, 'metric': metric, 'value': float(value), 'unit': unit,
+            'higher_is_better': higher_is_better, 'params': params}
+
+
+def _per_call(fn, args, rounds=3):
+    # Best of `rounds` mean seconds per call over all args
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for arg in args:
+            fn(*arg)
+        best = min(best, (time.perf_counter() - start) / len(args))
+    return best
+
+
+def micro(fleet_sizes=FLEET_SIZES, queries=2000, seed=0):
+    results = []
+    points = [tuple(p) for p in np.random.default_rng(seed).uniform(0, 100, (queries, 2)).tolist()]
+    for size in fleet_sizes:
+        scheduler = Scheduler({'seed': seed, 'customer_count': 1})
+        scheduler.add_riders(size)
+        seconds = _per_call(scheduler._get_best_rider, [(p,) for p in points])
+        results.append(result('micro', 'get_best_rider', 'latency', seconds * 1e6, 'us', False, riders=size))
+        seconds = _per_call(scheduler._calculate_distance, [(p, (50.0, 50.0)) for p in points])
+        results.append(result('micro', 'calculate_distance', 'latency', seconds * 1e6, 'us', False, riders=size))
+    return results
+
+
+def pipeline(ratios=RIDER_RATIOS, rates=ARRIVAL_RATES, customers=1000, duration=1800.0, seed=0, config=None):
+    results = []
+    for ratio in ratios:
+        for rate in rates:
+            scheduler = Scheduler(dict(PIPELINE_CONFIG, **(config or {}), seed=seed, customer_count=customers,
+                                       demand_rate=rate))
+            scheduler.add_riders(max(1, int(customers * ratio)))
+            engine = SimulationEngine(scheduler, None)
+            start = time.perf_counter()
+            engine.run(duration)
+            wall = time.perf_counter() - start
+            params = dict(riders=scheduler.riders.size, customers=customers, arrival_rate=rate, duration=duration)
+            # Simulated match rate: deterministic for a seed, so any change is a behaviour change
+            results.append(result('pipeline', 'engine', 'matches_per_sec', scheduler.metrics['throughput'] / duration,
+                                  'matches/s', True, **params))
+            results.append(result('pipeline', 'engine', 'events_per_sec', engine.events_processed / wall,
+                                  'events/s', True, **params))
+            for stage in STAGES:
+                if not scheduler.latency.count(stage):
+                    continue
+                for p, seconds in scheduler.latency.percentiles(stage, percentiles=PERCENTILES).items():
+                    results.append(result('pipeline', stage, f'p{p}', seconds, 's', False, **params))
+    return results
+
+
+def soak(duration=60.0, interval=1.0, riders=200, seed=0, config=None):
+    # Threaded run sampling process RSS and live threads; returns (results, samples)
+    process = psutil.Process()
+    scheduler = Scheduler(dict(config or {}, seed=seed))
+    scheduler.add_riders(riders)
+    samples = []
+    start = time.perf_counter()
+    scheduler.start()
+    try:
+        while time.perf_counter() - start < duration:
+            time.sleep(interval)
+            samples.append({'elapsed': time.perf_counter() - start, 'rss_mb': process.memory_info().rss / 2**20,
+                            'threads': threading.active_count(), 'throughput': scheduler.metrics['throughput']})
+    finally:
+        scheduler.stop(wait=True)
+    params = dict(riders=riders, duration=duration)
+    rss = [sample['rss_mb'] for sample in samples] or [0.0]
+    threads = [sample['threads'] for sample in samples] or [0]
+    results = [
+        result('soak', 'threads', 'peak_rss', max(rss), 'MB', False, **params),
+        result('soak', 'threads', 'rss_growth', rss[-1] - rss[0], 'MB', False, **params),
+        result('soak', 'threads', 'peak_threads', max(threads), 'threads', False, **params),
+        result('soak', 'threads', 'matches_per_sec', scheduler.metrics['throughput'] / duration, 'matches/s', True,
+               **params)
+    ]
+    return results, samples
+
+
+def key(row):
+    return (row['level'], row['name'], row['metric'], json.dumps(row['params'], sort_keys=True))
+
+
+def compare(baseline, current, threshold=0.1):
+    # Rows present in both runs with their relative change; a row regressed
+    # when it got worse by more than `threshold` (0.1 = 10%)
+    previous = {key(row): row for row in baseline['results']}
+    rows = []
+    for row in current['results']:
+        before = previous.get(key(row))
+        if before is None:
+            continue
+        change = (row['value'] - before['value']) / before['value'] if before['value'] else 0.0
+        worse = -change if row['higher_is_better'] else change
+        rows.append(dict(row, baseline=before['value'], change=change, regressed=worse > threshold))
+    return rows
+
+
+def write_csv(path, results):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['level', 'name', 'metric', 'value', 'unit', 'higher_is_better', 'params'])
+        for row in results:
+            writer.writerow([row['level'], row['name'], row['metric'], row['value'], row['unit'],
+                             row['higher_is_better'], json.dumps(row['params'], sort_keys=True)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless scheduler benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help="run benchmarks and write the results")
+    run.add_argument('--level', nargs='+', choices=('micro', 'pipeline', 'soak'), default=['micro', 'pipeline'])
+    run.add_argument('--output', default='benchmark.json')
+    run.add_argument('--csv', help="also write the results as CSV")
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--fleet-sizes', type=int, nargs='+', default=list(FLEET_SIZES))
+    run.add_argument('--duration', type=float, default=1800.0, help="virtual seconds per pipeline scenario")
+    run.add_argument('--soak-duration', type=float, default=60.0, help="wall seconds of the soak run")
+    check = commands.add_parser('compare', help="compare a run against a baseline")
+    check.add_argument('baseline')
+    check.add_argument('current')
+    check.add_argument('--threshold', type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        rows = compare(baseline, current, args.threshold)
+        for row in rows:
+            flag = 'REGRESSED' if row['regressed'] else ''
+            print(f"{row['level']:<8} {row['name']:<18} {row['metric']:<15} {json.dumps(row['params'], sort_keys=True):<70} "
+                  f"{row['baseline']:>12.4g} -> {row['value']:>12.4g} {row['unit']:<9} {row['change']:+7.1%} {flag}")
+        regressions = sum(row['regressed'] for row in rows)
+        print(f"{len(rows)} compared, {regressions} regressed")
+        return 1 if regressions else 0
+
+    results, samples = [], []
+    if 'micro' in args.level:
+        results += micro(args.fleet_sizes, seed=args.seed)
+    if 'pipeline' in args.level:
+        results += pipeline(duration=args.duration, seed=args.seed)
+    if 'soak' in args.level:
+        soak_results, samples = soak(args.soak_duration, seed=args.seed)
+        results += soak_results
+    report = {'manifest': seeding.manifest(vars(args), args.seed, cpu_count=psutil.cpu_count()),
+              'results': results, 'soak_samples': samples}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    if args.csv:
+        write_csv(args.csv, results)
+    for row in results:
+        print(f"{row['level']:<8} {row['name']:<18} {row['metric']:<15} {row['value']:>12.4g} {row['unit']:<9} {row['params']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
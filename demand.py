@@ -0,0 +1,98 @@
+import numpy as np
+
+
+class DemandGenerator:
+    # Pre-generates trip requests in NumPy batches as a superposition of
+    # Poisson processes:
+    #   - background demand at `rate` requests/s spread uniformly over the plane,
+    #     optionally shaped by a time-of-day `profile` (multipliers spaced evenly
+    #     over `period` seconds, linearly interpolated and wrapped);
+    #   - hotspots, each a dict {'center': (x, y), 'spread': sd, 'rate': r} with
+    #     optional 'start'/'end' seconds, which model surges around a point.
+    # Inhomogeneous rates use thinning. Arrivals are generated `chunk` seconds
+    # at a time as they are taken, so memory stays flat over any horizon, and a
+    # given seed always yields the same stream.
+    def __init__(self, rate, profile=None, period=86400.0, hotspots=(), seed=None,
+                 chunk=60.0, bounds=(0.0, 0.0, 100.0, 100.0), priorities=(1, 5)):
+        self.rate = rate
+        self.profile = None if profile is None else np.asarray(profile, dtype=float)
+        self.period = period
+        self.hotspots = [dict(hotspot) for hotspot in hotspots]
+        self.seed = seed
+        self.chunk_seconds = chunk
+        self.bounds = bounds  # (x_low, y_low, x_high, y_high) of background demand and hotspot clipping
+        self.priorities = priorities
+        self.reset()
+
+    def reset(self):
+        self.rng = np.random.default_rng(self.seed)
+        self._pending = self._empty()
+        self._cursor = 0
+        self._horizon = 0.0  # Everything before this has been generated
+
+    def _empty(self):
+        return (np.empty(0), np.empty(0), np.empty(0), np.empty(0, dtype=np.int64))
+
+    def rate_at(self, times):
+        # Background requests/s at each time
+        times = np.asarray(times, dtype=float)
+        if self.profile is None:
+            return np.full(times.shape, float(self.rate))
+        knots = np.linspace(0.0, self.period, len(self.profile) + 1)
+        values = np.append(self.profile, self.profile[0])
+        return self.rate * np.interp(times % self.period, knots, values)
+
+    def _poisson_times(self, peak_rate, start, end, rate_fn=None):
+        # Sorted arrival times in [start, end); rate_fn thins a peak_rate process
+        if peak_rate <= 0 or end <= start:
+            return np.empty(0)
+        count = self.rng.poisson(peak_rate * (end - start))
+        times = np.sort(self.rng.uniform(start, end, count))
+        if rate_fn is not None:
+            times = times[self.rng.random(count) * peak_rate < rate_fn(times)]
+        return times
+
+    def chunk(self, start, end):
+        # (times, xs, ys, priorities) of all requests in [start, end), ordered by time
+        x_low, y_low, x_high, y_high = self.bounds
+        peak = self.rate * (self.profile.max() if self.profile is not None else 1.0)
+        times = self._poisson_times(peak, start, end, self.rate_at if self.profile is not None else None)
+        parts = [(times, self.rng.uniform(x_low, x_high, len(times)), self.rng.uniform(y_low, y_high, len(times)))]
+        for hotspot in self.hotspots:
+            window_start = max(start, hotspot.get('start', start))
+            window_end = min(end, hotspot.get('end', end))
+            spot_times = self._poisson_times(hotspot['rate'], window_start, window_end)
+            cx, cy = hotspot['center']
+            spread = hotspot.get('spread', 5.0)
+            xs = np.clip(self.rng.normal(cx, spread, len(spot_times)), x_low, x_high)
+            ys = np.clip(self.rng.normal(cy, spread, len(spot_times)), y_low, y_high)
+            parts.append((spot_times, xs, ys))
+        times, xs, ys = (np.concatenate(column) for column in zip(*parts))
+        order = np.argsort(times, kind='stable')
+        priorities = self.rng.integers(self.priorities[0], self.priorities[1] + 1, len(times))
+        return times[order], xs[order], ys[order], priorities
+
+    def take(self, until):
+        # Returns every request not taken yet with time <= until, generating
+        # further chunks only as far as needed
+        parts = []
+        while True:
+            times = self._pending[0]
+            stop = int(np.searchsorted(times, until, side='right'))
+            if stop > self._cursor:
+                parts.append(tuple(column[self._cursor:stop] for column in self._pending))
+                self._cursor = stop
+            if stop < len(times) or self._horizon > until:
+                break
+            self._pending = self.chunk(self._horizon, self._horizon + self.chunk_seconds)
+            self._horizon += self.chunk_seconds
+            self._cursor = 0
+        if not parts:
+            return self._empty()
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def stream(self, start=0.0):
+        # Lazily yields consecutive chunks from `start` onwards
+        while True:
+            yield self.chunk(start, start + self.chunk_seconds)
+            start += self.chunk_seconds
@@ -0,0 +1,150 @@
+import heapq, itertools, time, queue
+from functools import partial
+from scheduler import TaskType, IDLE_METRICS
+
+
+class SimulationEngine:
+    # Discrete-event runtime for a Scheduler. Stage workers, trips, payments,
+    # feedback and arrivals become events on a heap ordered by a virtual
+    # clock, so the same Scheduler logic runs as fast as the CPU allows.
+    #
+    # speed=None runs unpaced; speed=1.0 paces virtual time against the wall
+    # clock (the real-time mode the dashboard uses), speed=10.0 runs 10x faster.
+    can_block = False  # Full queues reject instead of blocking the event loop
+
+    def __init__(self, scheduler, speed=None):
+        self.scheduler = scheduler
+        self.speed = speed
+        self.now = 0.0
+        self.events = []  # (time, seq, fn)
+        self._event_seq = itertools.count()
+        self.busy_workers = {task_type: 0 for task_type in TaskType}
+        self._held = 0.0
+        self._arrivals_started = False
+        self.events_processed = 0
+        scheduler.runtime = self
+
+    # Runtime interface used by Scheduler
+
+    def time(self):
+        return self.now
+
+    def sleep(self, delay):
+        raise RuntimeError("Blocking sleeps are not available under the simulation engine")
+
+    def spawn(self, fn):
+        fn()
+
+    def call_later(self, delay, fn):
+        heapq.heappush(self.events, (self.now + delay, next(self._event_seq), fn))
+
+    def hold(self, delay, fn):
+        # The stage worker running the current task stays busy until fn has run
+        self.call_later(delay, fn)
+        self._held = max(self._held, delay)
+
+    # Event loop
+
+    def reset(self):
+        self.now = 0.0
+        self.events = []
+        self._event_seq = itertools.count()  # Ties at equal times break in scheduling order
+        self.busy_workers = {task_type: 0 for task_type in TaskType}
+        self._arrivals_started = False
+        self.events_processed = 0
+
+    def _arrival(self):
+        self.call_later(self.scheduler._arrival_step(), self._arrival)
+
+    def _dispatch(self):
+        # Hand queued work to every idle stage worker
+        scheduler = self.scheduler
+        for task_type in TaskType:
+            task_queue = scheduler.queues[task_type]
+            while self.busy_workers[task_type] < scheduler.worker_targets[task_type]:
+                try:
+                    entry = task_queue.get_nowait()
+                except queue.Empty:
+                    break
+                scheduler._dequeued(task_type, entry)
+                self.busy_workers[task_type] += 1
+                self.call_later(scheduler._service_time(task_type),
+                                lambda t=task_type, e=entry, start=self.now, g=scheduler.generation:
+                                self._serve(t, e, start, g))
+
+    def _account_idle(self, until):
+        # Integrates idle worker time per stage up to `until`
+        elapsed = until - self.now
+        if elapsed > 0:
+            metrics, targets = self.scheduler.metrics, self.scheduler.worker_targets
+            for task_type in TaskType:
+                idle_workers = targets[task_type] - self.busy_workers[task_type]
+                if idle_workers > 0:
+                    metrics[IDLE_METRICS[task_type]] += idle_workers * elapsed
+
+    def _serve(self, task_type, entry, start_time, generation):
+        # Items dequeued before a scheduler reset are neither run nor counted
+        self._held = 0.0
+        self.scheduler._run_if_current(generation, partial(self.scheduler._run_task, task_type, entry))
+        if self._held:
+            self.call_later(self._held, lambda: self._release(task_type, start_time, generation))
+        else:
+            self._release(task_type, start_time, generation)
+
+    def _release(self, task_type, start_time, generation):
+        self.busy_workers[task_type] -= 1
+        self.scheduler._run_if_current(generation, partial(self.scheduler._record_service, task_type,
+                                                           self.now - start_time))
+
+    def _move(self):
+        self.scheduler.movement.tick()
+        self.call_later(self.scheduler.config['movement_tick'], self._move)
+
+    def _autoscale(self):
+        self.scheduler.autoscaler.step()
+        self.call_later(self.scheduler.config['autoscale_interval'], self._autoscale)
+
+    def _pace(self, event_time, wall_start, virtual_start):
+        # Sleep in short slices so a stop request is noticed promptly
+        while self.scheduler.running:
+            remaining = wall_start + (event_time - virtual_start) / self.speed - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.1))
+
+    def run(self, duration=None):
+        # Runs until scheduler.running is cleared, the event heap drains, or
+        # `duration` virtual seconds have elapsed. Returns the virtual time reached.
+        scheduler = self.scheduler
+        scheduler.running = True
+        until = None if duration is None else self.now + duration
+        if not self._arrivals_started:
+            self._arrivals_started = True
+            self.call_later(0.0, self._arrival)
+            if scheduler.autoscaler:
+                self.call_later(scheduler.config['autoscale_interval'], self._autoscale)
+            if scheduler.movement:
+                self.call_later(0.0, self._move)
+        wall_start, virtual_start = time.monotonic(), self.now
+        try:
+            while scheduler.running and self.events:
+                event_time, _, fn = self.events[0]
+                if until is not None and event_time > until:
+                    self._account_idle(until)
+                    self.now = until
+                    break
+                if self.speed:
+                    self._pace(event_time, wall_start, virtual_start)
+                    if not scheduler.running:
+                        break
+                heapq.heappop(self.events)
+                self._account_idle(event_time)
+                self.now = event_time
+                fn()
+                self._dispatch()
+                self.events_processed += 1
+        finally:
+            scheduler.running = False
+            if scheduler.trace:
+                scheduler.trace.flush()
+        return self.now
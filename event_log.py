@@ -0,0 +1,88 @@
+import itertools
+from collections import deque
+
+DEBUG, INFO, WARNING = 10, 20, 30
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING}
+
+# kind -> (level, message template); templates are only filled in when read
+EVENT_TYPES = {
+    'searching': (DEBUG, "🚗 [{customer}] Searching for rider..."),
+    'batch': (DEBUG, "🚗 Matching batch of {value:.0f} requests..."),
+    'matched': (INFO, "✅ [{customer}] Matched with {rider} in {value:.3f}s"),
+    'no_rider': (INFO, "⚠️ [{customer}] No riders available. Retrying..."),
+    'trip_completed': (INFO, "🏁 [{customer}] Trip completed ({value:.1f}s) → Processing payment"),
+    'payment_started': (DEBUG, "💸 [{customer}] Processing payment..."),
+    'payment_done': (INFO, "✅ [{customer}] Payment processed ({value:.1f}s) → Collecting feedback"),
+    'feedback_started': (DEBUG, "🌟 [{customer}] Collecting feedback..."),
+    'rated': (INFO, "⭐ [{customer}] Gave {value:.0f} stars to {rider}"),
+    'dropped': (WARNING, "🚫 [{customer}] {detail} request dropped (queue full)"),
+    'shed': (WARNING, "🚫 [{customer}] {detail} request shed (queue full)"),
+    'scaled_up': (INFO, "📈 {detail} (queue depth {value:.0f})"),
+    'scaled_down': (INFO, "📉 {detail} (queue depth {value:.0f})"),
+}
+
+FIELDS = ('seq', 'time', 'kind', 'customer', 'rider', 'value', 'detail')
+
+
+class EventLog:
+    # Fixed-capacity ring of structured events (seq, time, kind, customer,
+    # rider, value, detail). Appends are a single deque.append, which is
+    # atomic under the GIL, so writers never take a lock; events below
+    # `level` are skipped before anything is built. Names and messages are
+    # produced only when lines() or records() are read.
+    def __init__(self, capacity=10000, level='debug', customer_name=str, rider_name=str):
+        self.events = deque(maxlen=capacity)
+        self.level = LEVELS[level] if isinstance(level, str) else level
+        self.customer_name = customer_name
+        self.rider_name = rider_name
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.events)
+
+    def enabled(self, kind):
+        return EVENT_TYPES[kind][0] >= self.level
+
+    def emit(self, kind, time, customer=-1, rider=-1, value=0.0, detail=None):
+        if EVENT_TYPES[kind][0] >= self.level:
+            self.events.append((next(self._seq), time, kind, customer, rider, value, detail))
+
+    def append(self, event):
+        # Adds an event recorded elsewhere (e.g. by another process), keeping its fields
+        if EVENT_TYPES[event[2]][0] >= self.level:
+            self.events.append(event)
+
+    def clear(self):
+        self.events.clear()
+
+    def snapshot(self):
+        # Copy of the buffered events, oldest first
+        while True:
+            try:
+                return list(self.events)
+            except RuntimeError:  # Appended to mid-copy; try again
+                continue
+
+    def since(self, seq):
+        # Buffered events with a sequence number greater than seq
+        return [event for event in self.snapshot() if event[0] > seq]
+
+    def format(self, event):
+        _, _, kind, customer, rider, value, detail = event
+        return EVENT_TYPES[kind][1].format(
+            customer=self.customer_name(customer) if customer >= 0 else '',
+            rider=self.rider_name(rider) if rider >= 0 else '',
+            value=value, detail=detail)
+
+    def lines(self, count=100):
+        # The last `count` events as display strings, oldest first
+        return [self.format(event) for event in self.snapshot()[-count:]]
+
+    def records(self, since=-1):
+        # Events as dicts for exporters, with names and message filled in
+        result = []
+        for event in self.since(since):
+            record = dict(zip(FIELDS, event))
+            record['message'] = self.format(event)
+            result.append(record)
+        return result
@@ -0,0 +1,338 @@
+import threading, random
+import numpy as np
+
+RIDER_STATUSES = ('available', 'busy')
+CUSTOMER_STATUSES = ('idle', 'in_trip')
+
+AVAILABLE, BUSY = 0, 1
+IDLE, IN_TRIP = 0, 1
+
+LOCK_STRIPES = 256  # Entities share this many locks instead of owning one each
+
+
+class EntityStore:
+    # Column store for one kind of entity: each field is a NumPy array indexed
+    # by integer id and grown by doubling, so a million entities cost a few
+    # dozen bytes each and bulk reads/resets are array operations. Per-entity
+    # locks are striped: id i uses locks[i % LOCK_STRIPES].
+    columns = {'x': np.float64, 'y': np.float64, 'status': np.int8}
+    statuses = ()
+    label_format = '{}'
+    view_class = None
+
+    def __init__(self, capacity=64):
+        self.size = 0
+        for name, dtype in self.columns.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.labels = {}  # id -> name, only for entities added under an explicit name
+        self.ids = {}     # name -> id
+        self.locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.mutex = threading.Lock()  # Serialises adds (array growth replaces the columns)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def __getitem__(self, entity_id):
+        if not 0 <= entity_id < self.size:
+            raise KeyError(entity_id)
+        return self.view_class(self, entity_id)
+
+    def items(self):
+        return ((entity_id, self.view_class(self, entity_id)) for entity_id in range(self.size))
+
+    def _reserve(self, count):
+        capacity = len(self.x)
+        if self.size + count <= capacity:
+            return
+        while capacity < self.size + count:
+            capacity *= 2
+        for name in self.columns:
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def add(self, location, name=None):
+        with self.mutex:
+            self._reserve(1)
+            entity_id = self.size
+            self.x[entity_id], self.y[entity_id] = location
+            self._init_rows(slice(entity_id, entity_id + 1))
+            if name is not None:
+                self.labels[entity_id] = name
+                self.ids[name] = entity_id
+            self.size += 1
+            return entity_id
+
+    def add_many(self, xs, ys):
+        # Bulk add without names; returns the range of new ids
+        with self.mutex:
+            count = len(xs)
+            self._reserve(count)
+            start = self.size
+            rows = slice(start, start + count)
+            self.x[rows], self.y[rows] = xs, ys
+            self._init_rows(rows)
+            self.size += count
+            return range(start, start + count)
+
+    def _init_rows(self, rows):
+        self.status[rows] = 0
+
+    def name(self, entity_id):
+        label = self.labels.get(entity_id)
+        return label if label is not None else self.label_format.format(entity_id + 1)
+
+    def names(self):
+        return [self.name(entity_id) for entity_id in range(self.size)]
+
+    def id_of(self, name):
+        return self.ids[name]
+
+    def lock_for(self, entity_id):
+        return self.locks[entity_id % LOCK_STRIPES]
+
+    def location(self, entity_id):
+        return (float(self.x[entity_id]), float(self.y[entity_id]))
+
+    def locations(self, entity_ids):
+        # (n, 2) array of the given ids' coordinates
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        return np.column_stack((self.x[entity_ids], self.y[entity_ids]))
+
+    def count(self, status):
+        return int(np.count_nonzero(self.status[:self.size] == self.statuses.index(status)))
+
+    def with_status(self, status):
+        return np.flatnonzero(self.status[:self.size] == self.statuses.index(status))
+
+    def set_all(self, status):
+        self.status[:self.size] = self.statuses.index(status)
+
+
+class RiderView:
+    # Attribute access to one rider's row; holds no state of its own
+    __slots__ = ('store', 'id')
+
+    def __init__(self, store, rider_id):
+        self.store = store
+        self.id = rider_id
+
+    @property
+    def name(self):
+        return self.store.name(self.id)
+
+    @property
+    def status(self):
+        return RIDER_STATUSES[self.store.status[self.id]]
+
+    @property
+    def location(self):
+        return self.store.location(self.id)
+
+    @property
+    def trips_completed(self):
+        return int(self.store.trips[self.id])
+
+    @property
+    def rating_count(self):
+        return int(self.store.rating_count[self.id])
+
+    @property
+    def lock(self):
+        return self.store.lock_for(self.id)
+
+
+class RiderStore(EntityStore):
+    columns = dict(EntityStore.columns,
+                   trips=np.int32,
+                   rating_count=np.int32,
+                   rating_sum=np.int64,
+                   rating_weight=np.float64,        # Decayed count, used when rating_half_life is set
+                   rating_weighted_sum=np.float64,  # Decayed sum
+                   rated_at=np.float64,             # NaN until the first rating
+                   phase=np.int8,                   # Motion phase, see movement.py
+                   target_x=np.float64,             # Point the rider is heading for
+                   target_y=np.float64,
+                   dropoff_x=np.float64,            # Drop-off of the current trip
+                   dropoff_y=np.float64,
+                   passenger=np.int64,              # Customer on the current trip, -1 if none
+                   trip_started_at=np.float64)
+    statuses = RIDER_STATUSES
+    label_format = 'Rider_{}'
+    view_class = RiderView
+
+    def _init_rows(self, rows):
+        super()._init_rows(rows)
+        self.trips[rows] = 0
+        self.clear_ratings(rows)
+        self.phase[rows] = 0
+        self.passenger[rows] = -1
+
+    def clear_ratings(self, rows=None):
+        # Running aggregates replace a per-rider feedback list: memory stays
+        # constant per rider and the average is O(1) to read
+        rows = slice(0, self.size) if rows is None else rows
+        self.rating_count[rows] = 0
+        self.rating_sum[rows] = 0
+        self.rating_weight[rows] = 0.0
+        self.rating_weighted_sum[rows] = 0.0
+        self.rated_at[rows] = np.nan
+
+    def add_rating(self, rider_id, stars, now, half_life=None):
+        # Caller holds the rider's lock
+        self.rating_count[rider_id] += 1
+        self.rating_sum[rider_id] += stars
+        if half_life:
+            # Both decayed totals shrink by the same factor, so the average only
+            # moves when a new rating arrives and reads need no clock
+            rated_at = self.rated_at[rider_id]
+            decay = 1.0 if np.isnan(rated_at) else 0.5 ** ((now - rated_at) / half_life)
+            self.rating_weight[rider_id] = self.rating_weight[rider_id] * decay + 1.0
+            self.rating_weighted_sum[rider_id] = self.rating_weighted_sum[rider_id] * decay + stars
+        self.rated_at[rider_id] = now
+
+    def ratings(self, rider_ids=None, half_life=None, default=0.0):
+        # Average stars per rider (all riders when rider_ids is None), decayed
+        # when half_life is set; riders without ratings get `default`
+        rows = slice(0, self.size) if rider_ids is None else np.asarray(rider_ids, dtype=np.int64)
+        if half_life:
+            total, weight = self.rating_weighted_sum[rows], self.rating_weight[rows]
+        else:
+            total, weight = self.rating_sum[rows], self.rating_count[rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(weight > 0, total / weight, default)
+
+
+class CustomerView:
+    # Attribute access to one customer's row; holds no state of its own
+    __slots__ = ('store', 'id')
+
+    def __init__(self, store, customer_id):
+        self.store = store
+        self.id = customer_id
+
+    @property
+    def name(self):
+        return self.store.name(self.id)
+
+    @property
+    def status(self):
+        return CUSTOMER_STATUSES[self.store.status[self.id]]
+
+    @status.setter
+    def status(self, status):
+        if status == 'idle':
+            self.store.release(self.id)
+        else:
+            self.store.remove_idle(self.id)
+
+    @property
+    def location(self):
+        return self.store.location(self.id)
+
+    @property
+    def requested_at(self):
+        value = self.store.requested_at[self.id]
+        return None if np.isnan(value) else float(value)
+
+    @requested_at.setter
+    def requested_at(self, value):
+        self.store.requested_at[self.id] = np.nan if value is None else value
+
+    @property
+    def stage_started_at(self):
+        value = self.store.stage_started_at[self.id]
+        return None if np.isnan(value) else float(value)
+
+    @stage_started_at.setter
+    def stage_started_at(self, value):
+        self.store.stage_started_at[self.id] = np.nan if value is None else value
+
+    @property
+    def lock(self):
+        return self.store.lock_for(self.id)
+
+
+class CustomerStore(EntityStore):
+    # Idle customers are also kept in a dense pool (idle_ids[:idle_count]) with
+    # each customer's slot in idle_slot, so sampling, removal and release are
+    # O(1) swap-removes instead of scans. Pool and status change together under
+    # `mutex`.
+    columns = dict(EntityStore.columns,
+                   requested_at=np.float64,      # NaN until the first request
+                   stage_started_at=np.float64,  # When the current pipeline stage was queued
+                   wait_class=np.int8,           # Priority class of a request whose queue wait is unrecorded, else 0
+                   idle_ids=np.int64,            # Dense pool of idle customer ids
+                   idle_slot=np.int64)           # Position in idle_ids, -1 when not idle
+    statuses = CUSTOMER_STATUSES
+    label_format = 'Customer_{}'
+    view_class = CustomerView
+
+    def __init__(self, capacity=64):
+        self.idle_count = 0
+        super().__init__(capacity)
+
+    def _init_rows(self, rows):
+        # Called with mutex held; new customers start idle
+        super()._init_rows(rows)
+        self.requested_at[rows] = np.nan
+        self.stage_started_at[rows] = np.nan
+        count = rows.stop - rows.start
+        self.idle_ids[self.idle_count:self.idle_count + count] = np.arange(rows.start, rows.stop)
+        self.idle_slot[rows] = np.arange(self.idle_count, self.idle_count + count)
+        self.idle_count += count
+
+    def _take(self, customer_id):
+        # Swap-removes a customer from the idle pool; caller holds mutex
+        slot = self.idle_slot[customer_id]
+        last = self.idle_count - 1
+        moved = self.idle_ids[last]
+        self.idle_ids[slot] = moved
+        self.idle_slot[moved] = slot
+        self.idle_slot[customer_id] = -1
+        self.idle_count = last
+        self.status[customer_id] = IN_TRIP
+
+    def claim_random_idle(self, rng=random):
+        # Picks a uniformly random idle customer and marks them in_trip in one
+        # step; None when nobody is idle
+        with self.mutex:
+            if not self.idle_count:
+                return None
+            customer_id = int(self.idle_ids[rng.randrange(self.idle_count)])
+            self._take(customer_id)
+            return customer_id
+
+    def remove_idle(self, customer_id):
+        with self.mutex:
+            if self.idle_slot[customer_id] >= 0:
+                self._take(customer_id)
+
+    def release(self, customer_id):
+        # Returns a customer to the idle pool
+        with self.mutex:
+            if self.idle_slot[customer_id] < 0:
+                self.idle_ids[self.idle_count] = customer_id
+                self.idle_slot[customer_id] = self.idle_count
+                self.idle_count += 1
+                self.status[customer_id] = IDLE
+
+    def count(self, status):
+        if status == 'idle':
+            return self.idle_count
+        return super().count(status)
+
+    def set_all(self, status):
+        with self.mutex:
+            super().set_all(status)
+            if status == 'idle':
+                self.idle_ids[:self.size] = np.arange(self.size)
+                self.idle_slot[:self.size] = np.arange(self.size)
+                self.idle_count = self.size
+            else:
+                self.idle_slot[:self.size] = -1
+                self.idle_count = 0
@@ -0,0 +1,167 @@
+import math, threading, time
+from latency import LatencyHistogram
+
+QUANTILES = (50, 90, 99)
+
+
+class TimedLock:
+    # Drop-in wrapper for a threading or multiprocessing lock that counts
+    # acquisitions and measures how long contended acquirers waited. The
+    # uncontended path is one non-blocking acquire and no clock read. The
+    # counters are only updated by the thread that now holds the lock, so they
+    # need no lock of their own.
+    __slots__ = ('lock', 'acquisitions', 'contended', 'wait', 'max_wait')
+
+    def __init__(self, lock=None):
+        self.lock = threading.Lock() if lock is None else lock
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait = 0.0       # Seconds spent blocked
+        self.max_wait = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            self.acquisitions += 1
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self.lock.acquire() if timeout is None or timeout < 0 else self.lock.acquire(True, timeout)
+        if acquired:
+            waited = time.perf_counter() - start
+            self.acquisitions += 1
+            self.contended += 1
+            self.wait += waited
+            if waited > self.max_wait:
+                self.max_wait = waited
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+    def clear(self):
+        self.acquisitions = self.contended = 0
+        self.wait = self.max_wait = 0.0
+
+
+class Instruments:
+    # Always-on timing of the scheduler's internals: per-stage histograms
+    # (queue wait, service time) and wait statistics of the watched locks.
+    # Histograms are log-bucketed, so memory stays fixed however long the run.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # (measure, stage) -> LatencyHistogram
+        self.locks = {}       # name -> [TimedLock], e.g. all stripes of one store
+
+    def observe(self, measure, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get((measure, stage))
+            if histogram is None:
+                histogram = self.histograms[(measure, stage)] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def watch(self, name, locks):
+        # Wraps each lock in a TimedLock (reusing any already wrapped) and
+        # returns the wrapped list for the owner to use in place of the
+        # original; watching a name again replaces its locks
+        wrapped = [lock if isinstance(lock, TimedLock) else TimedLock(lock) for lock in locks]
+        self.locks[name] = wrapped
+        return wrapped
+
+    def lock_stats(self):
+        # {name: (acquisitions, contended, wait seconds, max wait seconds)} summed over stripes
+        stats = {}
+        for name, locks in self.locks.items():
+            stats[name] = (sum(lock.acquisitions for lock in locks), sum(lock.contended for lock in locks),
+                           sum(lock.wait for lock in locks), max((lock.max_wait for lock in locks), default=0.0))
+        return stats
+
+    def summaries(self):
+        # {(measure, stage): (count, sum, {quantile: seconds})}
+        with self.lock:
+            return {key: (histogram.count, histogram.sum, histogram.percentiles(QUANTILES))
+                    for key, histogram in self.histograms.items()}
+
+    def clear(self):
+        with self.lock:
+            self.histograms = {}
+        for locks in self.locks.values():
+            for lock in locks:
+                lock.clear()
+
+
+def _number(value):
+    return repr(float(value)) if math.isfinite(value) else ('+Inf' if value > 0 else 'NaN')
+
+
+def render(scheduler):
+    # Prometheus text exposition (format 0.0.4) of a Scheduler or ShardedScheduler
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+            lines.append(f"{name}{{{label_text}}} {_number(value)}" if label_text else f"{name} {_number(value)}")
+
+    metrics = dict(scheduler.metrics)
+    stages = ('trip', 'payment', 'feedback')
+    family('ridesharing_stage_busy_seconds_total', 'counter', "Worker seconds spent serving items",
+           [({'stage': stage}, metrics[f'{stage}_busy']) for stage in stages])
+    family('ridesharing_stage_idle_seconds_total', 'counter', "Worker seconds spent waiting for items",
+           [({'stage': stage}, metrics[f'{stage}_idle']) for stage in stages])
+    for key in ('throughput', 'completed_trips', 'queue_full', 'shed', 'dropped', 'unserved',
+                'reservation_conflicts', 'reservation_retries'):
+        family(f'ridesharing_{key}_total', 'counter', f"Cumulative {key.replace('_', ' ')}", [({}, metrics[key])])
+    family('ridesharing_in_flight_trips', 'gauge', "Trips currently under way", [({}, metrics['in_flight_trips'])])
+    family('ridesharing_queue_depth', 'gauge', "Items waiting per stage queue",
+           [({'stage': task_type.name.lower()}, task_queue.qsize()) for task_type, task_queue in scheduler.queues.items()])
+    if hasattr(scheduler, 'worker_targets'):
+        family('ridesharing_stage_workers', 'gauge', "Configured workers per stage",
+               [({'stage': task_type.name.lower()}, count) for task_type, count in scheduler.worker_targets.items()])
+    family('ridesharing_riders', 'gauge', "Riders per status",
+           [({'status': status}, scheduler.riders.count(status)) for status in ('available', 'busy')])
+    family('ridesharing_threads', 'gauge', "Live threads in the process", [({}, threading.active_count())])
+
+    latency = scheduler.latency
+    with latency.lock:
+        totals = {stage: (histogram.count, histogram.sum, histogram.percentiles(QUANTILES))
+                  for stage, histogram in latency.totals.items()}
+    samples = []
+    for stage, (count, total, quantiles) in totals.items():
+        samples += [({'stage': stage, 'quantile': p / 100}, seconds) for p, seconds in quantiles.items()]
+    family('ridesharing_latency_seconds', 'summary', "End-to-end latency per stage", samples)
+    for stage, (count, total, _) in totals.items():
+        lines.append(f'ridesharing_latency_seconds_sum{{stage="{stage}"}} {_number(total)}')
+        lines.append(f'ridesharing_latency_seconds_count{{stage="{stage}"}} {count}')
+
+    instruments = getattr(scheduler, 'instruments', None)
+    if instruments:
+        summaries = instruments.summaries()
+        for measure, help_text in (('queue_wait', "Enqueue to dequeue wait per stage queue"),
+                                   ('service', "Service time per stage item")):
+            name = f'ridesharing_stage_{measure}_seconds'
+            rows = [(stage, summary) for (kind, stage), summary in sorted(summaries.items()) if kind == measure]
+            family(name, 'summary', help_text,
+                   [({'stage': stage, 'quantile': p / 100}, seconds)
+                    for stage, (_, _, quantiles) in rows for p, seconds in quantiles.items()])
+            for stage, (count, total, _) in rows:
+                lines.append(f'{name}_sum{{stage="{stage}"}} {_number(total)}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        stats = instruments.lock_stats()
+        family('ridesharing_lock_acquisitions_total', 'counter', "Lock acquisitions",
+               [({'lock': name}, values[0]) for name, values in stats.items()])
+        family('ridesharing_lock_contended_total', 'counter', "Acquisitions that had to wait",
+               [({'lock': name}, values[1]) for name, values in stats.items()])
+        family('ridesharing_lock_wait_seconds_total', 'counter', "Seconds spent waiting to acquire",
+               [({'lock': name}, values[2]) for name, values in stats.items()])
+        family('ridesharing_lock_max_wait_seconds', 'gauge', "Longest single wait to acquire",
+               [({'lock': name}, values[3]) for name, values in stats.items()])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,190 @@
+import math, threading
+from collections import deque
+import numpy as np
+
+STAGES = ('match', 'queue_wait', 'payment', 'feedback')
+
+
+class LatencyHistogram:
+    # Log-bucketed histogram: memory is fixed by the value range and relative
+    # error, not by the number of samples. Bucket 0 holds values <= min_value
+    # (reported as 0), bucket i covers [min_value * g**(i-1), min_value * g**i).
+    def __init__(self, min_value=1e-6, max_value=3600.0, relative_error=0.02):
+        self.min_value = min_value
+        self.growth = math.log1p(2 * relative_error)
+        self.bucket_count = int(math.ceil(math.log(max_value / min_value) / self.growth)) + 2
+        self.values = min_value * np.exp(self.growth * (np.arange(self.bucket_count) - 0.5))
+        self.values[0] = 0.0
+        self.counts = np.zeros(self.bucket_count, dtype=np.int64)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def bucket(self, value):
+        if value <= self.min_value:
+            return 0
+        return min(self.bucket_count - 1, int(math.log(value / self.min_value) / self.growth) + 1)
+
+    def record(self, value):
+        self.counts[self.bucket(value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def add_counts(self, counts):
+        # Merges bucket counts from another histogram with the same layout;
+        # sum and max are then approximated from the bucket values
+        self.counts += counts
+        self.count += int(counts.sum())
+        self.sum += float(self.values @ counts)
+        filled = np.flatnonzero(counts)
+        if len(filled):
+            self.max = max(self.max, float(self.values[filled[-1]]))
+
+    def clear(self):
+        self.counts[:] = 0
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def percentiles(self, percentiles=(50, 95, 99), counts=None):
+        # {p: seconds}; cost depends on the bucket count only
+        counts = self.counts if counts is None else counts
+        cumulative = np.cumsum(counts)
+        total = int(cumulative[-1])
+        if not total:
+            return {p: 0.0 for p in percentiles}
+        result = {}
+        for p in percentiles:
+            rank = max(1, int(math.ceil(p / 100 * total)))
+            result[p] = float(self.values[np.searchsorted(cumulative, rank)])
+        if self.max and counts is self.counts:
+            result = {p: min(v, self.max) for p, v in result.items()}
+        return result
+
+
+class RollingHistogram(LatencyHistogram):
+    # LatencyHistogram over the last `window` seconds, kept as a ring of
+    # `slices` sub-histograms that are recycled as time moves on.
+    def __init__(self, window=60.0, slices=12, **bucket_args):
+        super().__init__(**bucket_args)
+        self.slice_length = window / slices
+        self.ring = np.zeros((slices, self.bucket_count), dtype=np.int64)
+        self.slice_index = None  # Absolute index of the newest slice
+
+    def _advance(self, now):
+        index = int(now // self.slice_length)
+        if self.slice_index is None:
+            self.slice_index = index
+        elif index > self.slice_index:
+            slices = len(self.ring)
+            for stale in range(self.slice_index + 1, min(index, self.slice_index + slices) + 1):
+                self.ring[stale % slices] = 0
+            self.slice_index = index
+        return index % len(self.ring)
+
+    def record(self, value, now):
+        self.ring[self._advance(now), self.bucket(value)] += 1
+
+    def add_counts(self, counts, now):
+        self.ring[self._advance(now)] += counts
+
+    def clear(self):
+        self.ring[:] = 0
+        self.slice_index = None
+
+    def window_percentiles(self, now, percentiles=(50, 95, 99)):
+        self._advance(now)
+        return self.percentiles(percentiles, counts=self.ring.sum(axis=0))
+
+
+class LatencyRecorder:
+    # Per-stage latency in fixed memory: an all-time histogram, a rolling
+    # window, queue waits per trip priority class, and a bounded series of
+    # windowed p50/p95/p99 points sampled every `series_interval` seconds.
+    def __init__(self, window=60.0, series_interval=1.0, series_length=300):
+        self.window = window
+        self.series_interval = series_interval
+        self.series_length = series_length
+        self.lock = threading.Lock()
+        self._empty()
+
+    def _empty(self):
+        self.totals = {stage: LatencyHistogram() for stage in STAGES}
+        self.recent = {stage: RollingHistogram(self.window) for stage in STAGES}
+        self.by_priority = {}
+        self.priority_totals = {}  # All-time queue waits per priority, for merging into another recorder
+        self.series = {stage: deque(maxlen=self.series_length) for stage in STAGES}
+        self._next_sample = None
+
+    def clear(self):
+        with self.lock:
+            self._empty()
+
+    def record(self, stage, value, now, priority=None):
+        with self.lock:
+            self.totals[stage].record(value)
+            self.recent[stage].record(value, now)
+            if priority is not None:
+                self._priority_histograms(priority)[0].record(value, now)
+                self._priority_histograms(priority)[1].record(value)
+            self._sample(now)
+
+    def merge(self, stage, counts, now, priority=None):
+        # Adds bucket counts from another recorder's counts() (e.g. in another
+        # process) as if they had been recorded at `now`. Stage and per-priority
+        # counts arrive under separate keys, so a priority merge only touches
+        # the priority histograms.
+        with self.lock:
+            if priority is None:
+                self.totals[stage].add_counts(counts)
+                self.recent[stage].add_counts(counts, now)
+            else:
+                self._priority_histograms(priority)[0].add_counts(counts, now)
+                self._priority_histograms(priority)[1].add_counts(counts)
+            self._sample(now)
+
+    def counts(self):
+        # Copies of the all-time bucket counts, keyed by stage or (stage, priority)
+        with self.lock:
+            result = {stage: histogram.counts.copy() for stage, histogram in self.totals.items()}
+            for priority, histogram in self.priority_totals.items():
+                result[('queue_wait', priority)] = histogram.counts.copy()
+            return result
+
+    def _priority_histograms(self, priority):
+        # (rolling, all-time) queue wait histograms of one priority class
+        if priority not in self.by_priority:
+            self.by_priority[priority] = RollingHistogram(self.window)
+            self.priority_totals[priority] = LatencyHistogram()
+        return self.by_priority[priority], self.priority_totals[priority]
+
+    def _sample(self, now):
+        if self._next_sample is None or now >= self._next_sample:
+            self._next_sample = now + self.series_interval
+            for name, histogram in self.recent.items():
+                if histogram.ring.any():
+                    self.series[name].append((now, histogram.window_percentiles(now)))
+
+    def percentiles(self, stage, now=None, percentiles=(50, 95, 99)):
+        # Rolling-window percentiles when `now` is given, all-time otherwise
+        with self.lock:
+            if now is None:
+                return self.totals[stage].percentiles(percentiles)
+            return self.recent[stage].window_percentiles(now, percentiles)
+
+    def priority_percentiles(self, now, percentiles=(50, 95, 99)):
+        with self.lock:
+            summary = {}
+            for priority, histogram in self.by_priority.items():
+                result = histogram.window_percentiles(now, percentiles)
+                if histogram.ring.any():
+                    summary[priority] = result
+            return summary
+
+    def count(self, stage):
+        return self.totals[stage].count
@@ -0,0 +1,81 @@
+import numpy as np
+
+UNMATCHED_COST = 1e6     # Cost of leaving a request unmatched in a batch
+INFEASIBLE_COST = 1e9    # Cost of a pair outside the matching radius
+
+
+def distance_matrix(points_a, points_b):
+    a = np.asarray(points_a, dtype=float).reshape(-1, 2)
+    b = np.asarray(points_b, dtype=float).reshape(-1, 2)
+    return np.sqrt(((a[:, None, :] - b[None, :, :])**2).sum(axis=2))
+
+
+def solve_assignment(cost):
+    # Hungarian algorithm (shortest augmenting paths with potentials) for an
+    # n x m cost matrix with n <= m. Returns col_for_row so that row i is
+    # assigned to column col_for_row[i] and the total cost is minimal.
+    cost = np.asarray(cost, dtype=float)
+    n, m = cost.shape
+    if n > m:
+        raise ValueError("solve_assignment needs at least as many columns as rows")
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of_col = np.zeros(m + 1, dtype=int)  # 1-based row matched to each column, 0 if free
+    way = np.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        row_of_col[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = row_of_col[j0]
+            free = np.flatnonzero(~used)
+            reduced = cost[i0 - 1, free - 1] - u[i0] - v[free]
+            better = reduced < minv[free]
+            minv[free[better]] = reduced[better]
+            way[free[better]] = j0
+            j1 = free[np.argmin(minv[free])]
+            delta = minv[j1]
+            taken = np.flatnonzero(used)
+            u[row_of_col[taken]] += delta
+            v[taken] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if row_of_col[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            row_of_col[j0] = row_of_col[j1]
+            j0 = j1
+    col_for_row = np.empty(n, dtype=int)
+    for j in range(1, m + 1):
+        if row_of_col[j]:
+            col_for_row[row_of_col[j] - 1] = j - 1
+    return col_for_row
+
+
+def assign_batch(customer_locs, rider_locs, max_radius=None, costs=None):
+    # Jointly assigns customers (ordered by priority, most urgent first) to
+    # riders minimising total pickup distance, or the given (customers, riders)
+    # cost matrix such as network ETAs; max_radius always applies to the
+    # straight-line distance. One dummy column per customer
+    # models "unmatched"; its cost rises with priority so that when riders run
+    # short the least urgent requests are the ones left over.
+    # Returns a rider index per customer, or -1 where it stays unmatched.
+    n = len(customer_locs)
+    if n == 0:
+        return np.empty(0, dtype=int)
+    distances = distance_matrix(customer_locs, rider_locs)
+    infeasible = distances > max_radius if max_radius is not None else None
+    if costs is not None:
+        distances = np.array(costs, dtype=float)
+    if infeasible is not None:
+        distances[infeasible] = INFEASIBLE_COST
+    urgency = 2.0 - np.arange(n) / n
+    dummy = np.full((n, n), INFEASIBLE_COST)
+    np.fill_diagonal(dummy, UNMATCHED_COST * urgency)
+    col_for_row = solve_assignment(np.hstack([distances, dummy]))
+    matched = col_for_row < distances.shape[1]
+    matched[matched] &= distances[matched, col_for_row[matched]] < INFEASIBLE_COST
+    return np.where(matched, col_for_row, -1)
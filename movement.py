@@ -0,0 +1,103 @@
+import threading
+import numpy as np
+from fleet import AVAILABLE
+
+# Rider motion phases (RiderStore.phase)
+PARKED, CRUISING, TO_PICKUP, TO_DROPOFF = 0, 1, 2, 3
+
+
+class RiderMovement:
+    # Advances every moving rider in one vectorized step per tick. A matched
+    # rider drives to the pickup, then to the drop-off, and the trip completes
+    # on arrival; with `cruise_speed` set, idle riders wander between random
+    # waypoints. Every available rider that moved is re-indexed in the same
+    # step, so matching always measures distances from current positions.
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.lock = threading.Lock()  # Serialises steps with trip starts
+        self.last_step = None
+        self.reindexed = 0  # Index updates made by steps
+
+    def reset(self):
+        riders = self.scheduler.riders
+        with self.lock:
+            riders.phase[:riders.size] = PARKED
+            riders.passenger[:riders.size] = -1
+            self.last_step = None
+            self.reindexed = 0
+
+    def begin_trip(self, rider_id, customer, now):
+        # The rider heads for the customer; the drop-off is a random point
+        riders = self.scheduler.riders
+        with self.lock:
+            riders.target_x[rider_id], riders.target_y[rider_id] = self.scheduler.customers.location(customer)
+            riders.dropoff_x[rider_id], riders.dropoff_y[rider_id] = self.scheduler.np_rng['movement'].uniform(0, 100, 2)
+            riders.passenger[rider_id] = customer
+            riders.trip_started_at[rider_id] = now
+            riders.phase[rider_id] = TO_PICKUP
+
+    def step(self, dt):
+        scheduler = self.scheduler
+        riders, config = scheduler.riders, scheduler.config
+        now = scheduler.runtime.time()
+        with self.lock:
+            n = riders.size
+            phase = riders.phase[:n]
+            # A sharded scheduler only drives the riders its region owns
+            owned = scheduler.shard.owned(n) if scheduler.shard else True
+            if config['cruise_speed']:
+                parked = np.flatnonzero((phase == PARKED) & (riders.status[:n] == AVAILABLE) & owned)
+                rng = scheduler.np_rng['movement']
+                riders.target_x[parked] = rng.uniform(0, 100, len(parked))
+                riders.target_y[parked] = rng.uniform(0, 100, len(parked))
+                phase[parked] = CRUISING
+
+            moving = np.flatnonzero((phase != PARKED) & owned)
+            if not len(moving):
+                return
+            x, y = riders.x[moving], riders.y[moving]
+            dx, dy = riders.target_x[moving] - x, riders.target_y[moving] - y
+            distance = np.hypot(dx, dy)
+            reach = np.where(phase[moving] == CRUISING, config['cruise_speed'], config['rider_speed']) * dt
+            arrived = distance <= reach
+            fraction = np.where(arrived, 1.0, reach / np.maximum(distance, 1e-12))
+            new_x, new_y = x + dx * fraction, y + dy * fraction
+            riders.x[moving], riders.y[moving] = new_x, new_y
+
+            # Phase changes for riders that reached their target
+            done = moving[arrived]
+            done_phase = phase[done]
+            picked_up = done[done_phase == TO_PICKUP]
+            riders.target_x[picked_up] = riders.dropoff_x[picked_up]
+            riders.target_y[picked_up] = riders.dropoff_y[picked_up]
+            phase[picked_up] = TO_DROPOFF
+            dropped_off = done[done_phase == TO_DROPOFF]
+            phase[done[done_phase == CRUISING]] = PARKED
+            phase[dropped_off] = PARKED
+            trips = [(int(riders.passenger[r]), int(r), now - float(riders.trip_started_at[r])) for r in dropped_off]
+            riders.passenger[dropped_off] = -1
+
+        # Reindex the moved riders; the index itself skips those that are not available
+        moved = moving[riders.status[moving] == AVAILABLE]
+        self.reindexed += scheduler.available_riders.move_many(
+            moved.tolist(), riders.x[moved].tolist(), riders.y[moved].tolist())
+        for customer, rider_id, duration in trips:
+            with scheduler.customers.lock_for(customer):
+                scheduler.customers.x[customer] = riders.x[rider_id]
+                scheduler.customers.y[customer] = riders.y[rider_id]
+            scheduler._complete_trip(customer, rider_id, duration)
+
+    def tick(self):
+        # One step covering the time since the previous tick
+        now = self.scheduler.runtime.time()
+        dt = 0.0 if self.last_step is None else now - self.last_step
+        self.last_step = now
+        if dt > 0:
+            self.step(dt)
+
+    def run(self, stopped):
+        # Threaded loop until `stopped` is set; the simulation engine calls
+        # tick() on its own clock instead
+        while self.scheduler.running and not stopped.is_set():
+            self.tick()
+            stopped.wait(self.scheduler.config['movement_tick'])
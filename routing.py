@@ -0,0 +1,174 @@
+import heapq, json, math
+from functools import lru_cache
+import numpy as np
+from spatial_index import GridIndex
+
+
+class RoadNetwork:
+    # Undirected road graph with travel times in seconds on the edges.
+    # Point-to-point queries run A* with landmark (ALT) lower bounds, which are
+    # precomputed once with one Dijkstra per landmark; node-pair results and
+    # whole shortest-path trees sit in LRU caches because the matcher asks for
+    # the same pairs over and over. Locations off the graph are snapped to the
+    # nearest node and the access leg is driven in a straight line.
+    def __init__(self, xs, ys, edges, speed=15.0, landmarks=8, cache_size=65536, tree_cache_size=256):
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+        self.speed = speed  # Plane units/s on access legs
+        self.adjacency = [[] for _ in range(len(self.xs))]  # node -> [(neighbour, seconds)]
+        for u, v, seconds in edges:
+            self.adjacency[u].append((v, seconds))
+            self.adjacency[v].append((u, seconds))
+        spacing = max(1e-9, min(self._edge_length(u, v) for u, v, _ in edges)) if edges else 1.0
+        self.nodes = GridIndex(spacing)
+        for node, (x, y) in enumerate(zip(self.xs.tolist(), self.ys.tolist())):
+            self.nodes.insert(node, (x, y))
+        self.landmarks, self.landmark_rows = self._pick_landmarks(landmarks)
+        self.node_distance = lru_cache(maxsize=cache_size)(self._node_distance)
+        self.distances_from = lru_cache(maxsize=tree_cache_size)(self._distances_from)
+
+    def __len__(self):
+        return len(self.xs)
+
+    @classmethod
+    def grid_city(cls, spacing=5.0, size=100.0, speed=15.0, arterial_every=4, arterial_factor=1.5,
+                  congestion=(0.6, 1.0), seed=None, **kwargs):
+        # Manhattan-style city: intersections every `spacing` units, every
+        # `arterial_every`-th street faster, the rest slowed by random congestion
+        rng = np.random.default_rng(seed)
+        count = int(round(size / spacing)) + 1
+        grid = np.arange(count) * spacing
+        xs, ys = np.meshgrid(grid, grid, indexing='ij')
+        node = lambda i, j: i * count + j
+        edges = []
+        for i in range(count):
+            for j in range(count):
+                if i + 1 < count:  # Along x, on street j
+                    factor = arterial_factor if j % arterial_every == 0 else rng.uniform(*congestion)
+                    edges.append((node(i, j), node(i + 1, j), spacing / (speed * factor)))
+                if j + 1 < count:  # Along y, on avenue i
+                    factor = arterial_factor if i % arterial_every == 0 else rng.uniform(*congestion)
+                    edges.append((node(i, j), node(i, j + 1), spacing / (speed * factor)))
+        return cls(xs.ravel(), ys.ravel(), edges, speed=speed, **kwargs)
+
+    @classmethod
+    def load(cls, path, speed=15.0, **kwargs):
+        # JSON file: {"nodes": [[x, y], ...], "edges": [[u, v, seconds], ...]};
+        # an edge without seconds is timed at `speed` over its length
+        with open(path) as f:
+            data = json.load(f)
+        xs, ys = zip(*data['nodes'])
+        edges = []
+        for edge in data['edges']:
+            u, v = int(edge[0]), int(edge[1])
+            seconds = float(edge[2]) if len(edge) > 2 else math.hypot(xs[u] - xs[v], ys[u] - ys[v]) / speed
+            edges.append((u, v, seconds))
+        return cls(xs, ys, edges, speed=speed, **kwargs)
+
+    def _edge_length(self, u, v):
+        return math.hypot(self.xs[u] - self.xs[v], self.ys[u] - self.ys[v])
+
+    def _dijkstra(self, source):
+        distances = [math.inf] * len(self.xs)
+        distances[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+            for neighbour, seconds in self.adjacency[node]:
+                candidate = distance + seconds
+                if candidate < distances[neighbour]:
+                    distances[neighbour] = candidate
+                    heapq.heappush(heap, (candidate, neighbour))
+        return distances
+
+    def _pick_landmarks(self, count):
+        # Farthest-point selection: each landmark is the node farthest (in
+        # travel time) from those picked so far
+        if not len(self.xs) or count <= 0:
+            return [], []
+        landmarks, trees = [], []
+        closest = np.full(len(self.xs), np.inf)
+        candidate = 0
+        for _ in range(min(count, len(self.xs))):
+            tree = np.array(self._dijkstra(candidate))
+            landmarks.append(candidate)
+            trees.append(tree)
+            closest = np.minimum(closest, tree)
+            reachable = np.where(np.isfinite(closest), closest, -1.0)
+            candidate = int(np.argmax(reachable))
+        # Per node, its distance to every landmark, as lists for the A* inner loop
+        return landmarks, np.column_stack(trees).tolist()
+
+    def _search(self, source, target):
+        # ALT A*: returns (seconds, parent map)
+        rows = self.landmark_rows
+        target_row = rows[target] if rows else ()
+        def bound(node):
+            return max((abs(t - d) for t, d in zip(target_row, rows[node])), default=0.0)
+        best = {source: 0.0}
+        parents = {source: None}
+        heap = [(bound(source), 0.0, source)]
+        closed = set()
+        while heap:
+            _, distance, node = heapq.heappop(heap)
+            if node == target:
+                return distance, parents
+            if node in closed:
+                continue
+            closed.add(node)
+            for neighbour, seconds in self.adjacency[node]:
+                candidate = distance + seconds
+                if candidate < best.get(neighbour, math.inf):
+                    best[neighbour] = candidate
+                    parents[neighbour] = node
+                    heapq.heappush(heap, (candidate + bound(neighbour), candidate, neighbour))
+        return math.inf, parents
+
+    def _node_distance(self, source, target):
+        if source == target:
+            return 0.0
+        if source > target:  # Undirected, so both orders share a cache entry
+            return self.node_distance(target, source)
+        return self._search(source, target)[0]
+
+    def _distances_from(self, source):
+        return np.array(self._dijkstra(source))
+
+    def nearest_node(self, loc):
+        _, nodes = self.nodes.nearest(loc)
+        return nodes[0]
+
+    def _access(self, loc, node):
+        return math.hypot(loc[0] - self.xs[node], loc[1] - self.ys[node]) / self.speed
+
+    def eta(self, origin, destination):
+        # Seconds from one plane location to another over the network
+        a, b = self.nearest_node(origin), self.nearest_node(destination)
+        return self._access(origin, a) + self.node_distance(a, b) + self._access(destination, b)
+
+    def route(self, origin, destination):
+        # (seconds, [node ids along the shortest path])
+        a, b = self.nearest_node(origin), self.nearest_node(destination)
+        seconds, parents = self._search(a, b)
+        path = []
+        node = b if b in parents else None
+        while node is not None:
+            path.append(node)
+            node = parents[node]
+        return self._access(origin, a) + seconds + self._access(destination, b), path[::-1]
+
+    def eta_matrix(self, origins, destinations):
+        # (len(origins), len(destinations)) seconds, one cached shortest-path
+        # tree per origin node instead of one search per pair
+        origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        target_nodes = np.array([self.nearest_node(tuple(loc)) for loc in destinations.tolist()], dtype=np.int64)
+        target_access = np.hypot(destinations[:, 0] - self.xs[target_nodes],
+                                 destinations[:, 1] - self.ys[target_nodes]) / self.speed
+        result = np.empty((len(origins), len(destinations)))
+        for row, loc in enumerate(origins.tolist()):
+            node = self.nearest_node(tuple(loc))
+            result[row] = self._access(loc, node) + self.distances_from(node)[target_nodes] + target_access
+        return result
@@ -0,0 +1,63 @@
+import threading, time, heapq, itertools, traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ThreadRuntime:
+    # Wall-clock runtime used by the threaded workers. Spawned work runs on a
+    # bounded thread pool and deferred work (in-flight trips, retries) waits on
+    # a single timer thread, so the thread count does not grow with the number
+    # of concurrent trips.
+    can_block = True  # add_task may wait for queue space
+
+    def __init__(self, pool_size=8):
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='trip')
+        self.timers = []  # (due, seq, fn)
+        self._timer_seq = itertools.count()
+        self._timer_cond = threading.Condition()
+        self._timer_thread = None
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, delay):
+        time.sleep(delay)
+
+    def _run(self, fn):
+        try:
+            fn()
+        except Exception:
+            traceback.print_exc()
+
+    def spawn(self, fn):
+        # Run fn concurrently with the caller
+        self.executor.submit(self._run, fn)
+
+    def call_later(self, delay, fn):
+        # Run fn on the pool after delay without blocking the caller
+        with self._timer_cond:
+            heapq.heappush(self.timers, (time.monotonic() + delay, next(self._timer_seq), fn))
+            if self._timer_thread is None:
+                self._timer_thread = threading.Thread(target=self._timer_loop, name='trip-timers', daemon=True)
+                self._timer_thread.start()
+            self._timer_cond.notify()
+
+    def hold(self, delay, fn):
+        # Keep the calling worker occupied for delay, then run fn
+        time.sleep(delay)
+        fn()
+
+    def pending_timers(self):
+        return len(self.timers)
+
+    def _timer_loop(self):
+        while True:
+            with self._timer_cond:
+                while not self.timers:
+                    self._timer_cond.wait()
+                due, _, fn = self.timers[0]
+                remaining = due - time.monotonic()
+                if remaining > 0:
+                    self._timer_cond.wait(remaining)
+                    continue
+                heapq.heappop(self.timers)
+            self.spawn(fn)
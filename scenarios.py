@@ -0,0 +1,159 @@
+import argparse, itertools, json, multiprocessing, os, re, sys, time
+import numpy as np
+import pandas as pd
+from scheduler import Scheduler, DEFAULT_CONFIG
+from engine import SimulationEngine
+from latency import STAGES
+import tracing
+
+# Batch scenario runner: each scenario is a Scheduler config plus a fleet size
+# and a duration, run headless under the simulation engine (unpaced), several
+# at a time in separate processes. Scenario file (JSON):
+#
+#   {"defaults": {"riders": 20, "duration": 600, "customer_count": 40, ...},
+#    "scenarios": [{"name": "busy", "arrival_interval": [0.1, 0.5]}, ...],
+#    "sweep": {"riders": [10, 20, 40], "demand_rate": [1.0, 5.0]}}
+#
+# Every entry of "scenarios" and every combination of "sweep" (applied on top
+# of each scenario, or of the defaults alone) becomes one run. Outputs go to
+# --output: summary.csv (one row per run, appended as runs finish) and
+# trips/<name>.csv|parquet with one row per trip request.
+
+RUN_KEYS = {'name': None, 'riders': 20, 'duration': 600.0}  # Scenario keys that are not Scheduler config
+
+
+def expand(spec):
+    # List of scenario dicts (run keys + config overrides) from a scenario file
+    defaults = dict(RUN_KEYS, **spec.get('defaults', {}))
+    bases = spec.get('scenarios') or [{}]
+    sweep = spec.get('sweep', {})
+    names, values = list(sweep), [sweep[name] for name in sweep]
+    scenarios = []
+    for index, base in enumerate(bases):
+        for combination in itertools.product(*values):
+            scenario = dict(defaults, **base, **dict(zip(names, combination)))
+            label = re.sub(r'[^\w.=,+-]', '', ','.join(f"{name}={value}" for name, value in zip(names, combination)))
+            prefix = base.get('name') or (f"scenario{index}" if len(bases) > 1 else '')
+            scenario['name'] = '_'.join(part for part in (prefix, label) if part) or 'scenario'
+            unknown = set(scenario) - set(RUN_KEYS) - set(DEFAULT_CONFIG)
+            if unknown:
+                raise ValueError(f"Unknown settings in scenario {scenario['name']}: {', '.join(sorted(unknown))}")
+            scenarios.append(scenario)
+    return scenarios
+
+
+def trip_records(trace):
+    # One row per trip request from a trace: a customer's records between two
+    # of their arrivals belong to the same request, since a customer only
+    # requests again once the previous trip is finished or dropped
+    frame = pd.DataFrame({name: np.asarray(trace[name]) for name in ('time', 'value', 'customer', 'rider', 'kind')})
+    frame = frame[frame['customer'] >= 0]
+    frame['trip'] = (frame['kind'] == tracing.ARRIVAL).groupby(frame['customer']).cumsum()
+    frame = frame[frame['trip'] > 0]
+    columns = {
+        tracing.ARRIVAL: {'time': 'requested_at'},
+        tracing.MATCH: {'time': 'matched_at', 'rider': 'rider', 'value': 'response_time'},
+        tracing.TRIP_END: {'time': 'trip_completed_at', 'value': 'trip_duration'},
+        tracing.PAYMENT: {'time': 'paid_at', 'value': 'payment_time'},
+        tracing.FEEDBACK: {'time': 'rated_at', 'value': 'rating'},
+    }
+    trips = frame[frame['kind'] == tracing.ARRIVAL][['customer', 'trip']]
+    for kind, renames in columns.items():
+        if kind == tracing.ARRIVAL:
+            part = frame[frame['kind'] == kind]
+        else:
+            part = frame[frame['kind'] == kind].drop_duplicates(['customer', 'trip'], keep='last')
+        trips = trips.merge(part[['customer', 'trip', *renames]].rename(columns=renames), how='left',
+                            on=['customer', 'trip'])
+    dropped = frame[frame['kind'].isin([tracing.DROPPED, tracing.SHED])][['customer', 'trip']].drop_duplicates()
+    trips['dropped'] = trips.set_index(['customer', 'trip']).index.isin(dropped.set_index(['customer', 'trip']).index)
+    trips['wait'] = trips['matched_at'] - trips['requested_at']
+    # The left merges leave NaN for unmatched or unrated trips; keep ids and stars integer
+    trips[['rider', 'rating']] = trips[['rider', 'rating']].astype('Int64')
+    return trips.sort_values('requested_at', kind='stable').reset_index(drop=True)
+
+
+def run_scenario(args):
+    # Worker entry point: runs one scenario, writes its trips file, returns its summary row
+    scenario, index, output, file_format, seed = args
+    config = {key: value for key, value in scenario.items() if key not in RUN_KEYS}
+    if config.get('seed') is None and seed is not None:
+        config['seed'] = [seed, index]
+    trace_path = os.path.join(output, 'trips', f".{scenario['name']}.trace")
+    scheduler = Scheduler(dict(config, trace_path=trace_path))
+    scheduler.add_riders(scenario['riders'])
+    engine = SimulationEngine(scheduler, None)
+    start = time.perf_counter()
+    engine.run(scenario['duration'])
+    wall = time.perf_counter() - start
+    scheduler.trace.close()
+
+    trips = trip_records(tracing.load(trace_path))
+    os.remove(trace_path)
+    path = os.path.join(output, 'trips', f"{scenario['name']}.{file_format}")
+    if file_format == 'parquet':
+        trips.to_parquet(path, index=False)
+    else:
+        trips.to_csv(path, index=False)
+
+    row = {key: scenario[key] for key in RUN_KEYS}
+    row.update({key: json.dumps(value) if isinstance(value, (list, tuple, dict)) else value
+                for key, value in config.items()})
+    row.update(seed=json.dumps(scheduler.seed), wall_seconds=wall, events=engine.events_processed,
+               requests=len(trips), matches_per_second=scheduler.metrics['throughput'] / scenario['duration'])
+    row.update(scheduler.metrics)
+    for stage in STAGES:
+        for p, seconds in scheduler.latency.percentiles(stage).items():
+            row[f'{stage}_p{p}'] = seconds if scheduler.latency.count(stage) else None
+    return row
+
+
+def run_all(scenarios, output, processes=None, file_format='csv', seed=None):
+    # Runs scenarios in a process pool; rows are appended to summary.csv as they finish
+    if file_format == 'parquet':
+        try:
+            pd.io.parquet.get_engine('auto')
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow or fastparquet installed; use --format csv")
+    os.makedirs(os.path.join(output, 'trips'), exist_ok=True)
+    summary_path = os.path.join(output, 'summary.csv')
+    jobs = [(scenario, index, output, file_format, seed) for index, scenario in enumerate(scenarios)]
+    # Fixed columns across runs: run keys, every setting any scenario overrides, then the results
+    settings = sorted(set().union(*scenarios) - set(RUN_KEYS) - {'seed'})
+    columns = None
+    rows = []
+    with multiprocessing.Pool(processes) as pool:
+        for done, row in enumerate(pool.imap_unordered(run_scenario, jobs), 1):
+            if columns is None:
+                columns = list(RUN_KEYS) + settings + [key for key in row if key not in RUN_KEYS and key not in settings]
+            rows.append(row)
+            pd.DataFrame([row]).reindex(columns=columns).to_csv(summary_path, mode='a', index=False, header=done == 1)
+            print(f"[{done}/{len(jobs)}] {row['name']}: {row['throughput']} matches, "
+                  f"{row['completed_trips']} completed in {row['wall_seconds']:.1f}s", flush=True)
+    return pd.DataFrame(rows).reindex(columns=columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run simulation scenarios headless")
+    parser.add_argument('scenario_file', help="JSON file with defaults, scenarios and/or sweep")
+    parser.add_argument('--output', default='results', help="directory for summary.csv and per-trip files")
+    parser.add_argument('--processes', type=int, default=None, help="parallel runs (default: CPU count)")
+    parser.add_argument('--format', choices=('csv', 'parquet'), default='csv', help="per-trip file format")
+    parser.add_argument('--seed', type=int, default=None, help="base seed; each run derives its own from it")
+    parser.add_argument('--list', action='store_true', help="print the expanded scenarios and exit")
+    args = parser.parse_args(argv)
+
+    with open(args.scenario_file) as f:
+        scenarios = expand(json.load(f))
+    if args.list:
+        for scenario in scenarios:
+            print(json.dumps(scenario))
+        return 0
+    if os.path.exists(os.path.join(args.output, 'summary.csv')):
+        raise SystemExit(f"{args.output}/summary.csv already exists")
+    run_all(scenarios, args.output, args.processes, args.format, args.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,221 +1,842 @@
-import threading, queue, time, random, math
+import threading, queue, math, itertools
 from enum import Enum
+from functools import partial
+import numpy as np
+from spatial_index import GridIndex
+from fleet import RiderStore, CustomerStore, AVAILABLE, BUSY
+from matching import assign_batch
+from runtime import ThreadRuntime
+from autoscaler import Autoscaler
+from trip_queue import TripQueue
+from latency import LatencyRecorder
+from demand import DemandGenerator
+from movement import RiderMovement
+from routing import RoadNetwork
+from event_log import EventLog
+import tracing
+import seeding
+from instrumentation import Instruments
+from snapshot import SnapshotPublisher
+
+DEFAULT_CONFIG = {
+    'grid_cell_size': None,      # Side of a spatial index cell on the 100x100 plane, None sizes cells from the fleet
+    'max_search_radius': None,   # Matching radius cutoff, None searches the whole plane
+    'matching_mode': 'greedy',   # 'greedy' matches one request at a time, 'batch' solves queued requests jointly
+    'batch_size': 32,            # Max requests drained per batch
+    'batch_window': 0.0,         # Seconds to keep collecting requests before solving a batch
+    'batch_candidates': 8,       # Nearest riders per request considered in a batch
+    'matching_service_time': 0.7,    # Seconds a worker spends per trip matching item
+    'payment_service_time': 0.5,     # Seconds a worker spends per payment item
+    'feedback_service_time': 0.3,    # Seconds a worker spends per feedback item
+    'trip_duration': (3.0, 8.0),     # Uniform range of trip lengths in seconds
+    'payment_duration': (0.5, 1.5),  # Uniform range of payment processing in seconds
+    'feedback_duration': 0.5,        # Seconds spent collecting feedback
+    'retry_delay': 0.5,              # Seconds before an unmatched request is re-queued
+    'arrival_probability': 0.9,      # Chance that an arrival tick produces a trip request
+    'arrival_interval': (0.1, 0.3),  # Uniform range of seconds between arrival ticks
+    'trip_pool_size': 8,             # Threads running trip matching and trip callbacks
+    'matching_workers': 1,           # Consumer threads on the trip matching queue
+    'payment_workers': 1,            # Consumer threads on the payment queue
+    'feedback_workers': 1,           # Consumer threads on the feedback queue
+    'autoscale': False,              # Resize stage worker pools from queue depth
+    'autoscale_interval': 1.0,       # Seconds between autoscaler checks
+    'autoscale_min_workers': 1,      # Lower bound on workers per stage
+    'autoscale_max_workers': 8,      # Upper bound on workers per stage
+    'autoscale_target_drain': 2.0,   # Seconds a stage should need to drain its backlog
+    'autoscale_up_checks': 2,        # Consecutive checks wanting more workers before scaling up
+    'autoscale_down_checks': 5,      # Consecutive checks wanting fewer workers before scaling down
+    'autoscale_cooldown': 3.0,       # Seconds after a change before the same stage may change again
+    'matching_queue_capacity': 0,    # Max queued trip requests, 0 for unbounded
+    'payment_queue_capacity': 0,     # Max queued payments, 0 for unbounded
+    'feedback_queue_capacity': 0,    # Max queued feedback items, 0 for unbounded
+    'overload_policy': 'block',      # Full queue: 'block', 'shed' the least urgent trip request, or 'reject'
+    'block_timeout': 1.0,            # Seconds add_task may block before the task is dropped
+    'arrival_backoff_max': 8.0,      # Largest factor the arrival interval is stretched by after rejections
+    'trip_ordering': 'priority',     # Trip queue order: 'priority', 'aging' (wait raises priority) or 'edf'
+    'priority_aging_rate': 0.1,      # Priority levels a waiting request gains per second under 'aging'
+    'edf_deadline_step': 5.0,        # Seconds of deadline per priority level under 'edf'
+    'latency_window': 60.0,          # Seconds covered by the rolling latency percentiles
+    'rating_half_life': None,        # Seconds for a rating's weight to halve, None averages all ratings equally
+    'customer_count': 40,            # Customers created up front
+    'demand_rate': None,             # Background requests/s from the demand generator, None keeps the tick-based arrivals
+    'demand_profile': None,          # Time-of-day multipliers of demand_rate spread evenly over demand_period
+    'demand_period': 86400.0,        # Seconds covered by demand_profile before it repeats
+    'demand_hotspots': (),           # Surge dicts: {'center': (x, y), 'spread': sd, 'rate': r, 'start': s, 'end': e}
+    'demand_seed': None,             # Seed of the demand generator, None derives one from seed
+    'demand_chunk': 60.0,            # Seconds of demand generated per batch
+    'demand_tick': 0.1,              # Seconds between bulk releases of due requests
+    'rider_speed': None,             # Plane units/s riders drive to pickups and drop-offs, None keeps riders static with timed trips
+    'cruise_speed': 0.0,             # Plane units/s idle riders wander at when rider_speed is set, 0 parks them
+    'movement_tick': 0.1,            # Seconds between fleet position updates
+    'road_network': None,            # None for straight lines, 'grid' for a generated city, or a JSON graph path
+    'road_spacing': 5.0,             # Block length of the generated grid city
+    'road_speed': 15.0,              # Plane units/s at free flow (and on the legs to and from the network)
+    'road_seed': None,               # Seed of the grid city's congestion, None derives one from seed
+    'road_landmarks': 8,             # Landmarks precomputed for A* lower bounds
+    'route_cache_size': 65536,       # Node pairs kept in the shortest-distance LRU cache
+    'eta_candidates': 8,             # Nearest riders by straight line that get a network ETA when matching
+    'reservation_attempts': 3,       # Picks per match before giving up when other matchers keep winning the rider
+    'shard_sync_interval': 0.5,      # Virtual seconds between a shard's reconcile and report
+    'shard_border_band': 10.0,       # How far past its border a shard looks for neighbours' riders
+    'shard_start_method': 'fork',    # multiprocessing start method for shard processes
+    'log_capacity': 10000,           # Events kept in the event log ring buffer
+    'log_level': 'debug',            # Lowest event level recorded: 'debug', 'info' or 'warning'
+    'trace_path': None,              # Binary event trace file (see tracing.py), None disables tracing
+    'trace_buffer': 65536,           # Trace records buffered between batch writes
+    'seed': None,                    # Master seed of every random stream (see seeding.py), None picks one
+    'instrumentation': True,         # Per-stage queue wait/service histograms and lock wait counters
+    'snapshot_interval': 0.5         # Wall seconds a published dashboard snapshot is reused before rebuilding
+}
+
+SERVICE_TIME_SMOOTHING = 0.2  # Weight of the newest item in the per-stage service time average
+
+WORKER_POLL_TIMEOUT = 0.1  # Longest an idle worker blocks before re-checking `running`
 
 class TaskType(Enum):
     TRIP_MATCHING = 0
     PAYMENT = 1
     FEEDBACK = 2
 
+SERVICE_TIME_KEYS = {
+    TaskType.TRIP_MATCHING: 'matching_service_time',
+    TaskType.PAYMENT: 'payment_service_time',
+    TaskType.FEEDBACK: 'feedback_service_time'
+}
+
+WORKER_KEYS = {
+    TaskType.TRIP_MATCHING: 'matching_workers',
+    TaskType.PAYMENT: 'payment_workers',
+    TaskType.FEEDBACK: 'feedback_workers'
+}
+
+BUSY_METRICS = {
+    TaskType.TRIP_MATCHING: 'trip_busy',
+    TaskType.PAYMENT: 'payment_busy',
+    TaskType.FEEDBACK: 'feedback_busy'
+}
+
+IDLE_METRICS = {
+    TaskType.TRIP_MATCHING: 'trip_idle',
+    TaskType.PAYMENT: 'payment_idle',
+    TaskType.FEEDBACK: 'feedback_idle'
+}
+
+CAPACITY_KEYS = {
+    TaskType.TRIP_MATCHING: 'matching_queue_capacity',
+    TaskType.PAYMENT: 'payment_queue_capacity',
+    TaskType.FEEDBACK: 'feedback_queue_capacity'
+}
+
+def empty_metrics():
+    # Stage busy/idle seconds and event counters, all cumulative since the last reset
+    return {
+        'trip_busy': 0.0,
+        'trip_idle': 0.0,
+        'payment_busy': 0.0,
+        'payment_idle': 0.0,
+        'feedback_busy': 0.0,
+        'feedback_idle': 0.0,
+        'throughput': 0,
+        'completed_trips': 0,
+        'in_flight_trips': 0,
+        'queue_full': 0,
+        'shed': 0,
+        'dropped': 0,
+        'unserved': 0,
+        'reservation_conflicts': 0,
+        'reservation_retries': 0
+    }
+
 class Scheduler:
-    def __init__(self):
+    def __init__(self, config=None):
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        # Per-subsystem random streams; runs under the simulation engine with
+        # the same seed and config are identical event for event
+        self.seed = seeding.resolve_seed(self.config['seed'])
+        self.rng, self.np_rng = seeding.streams(self.seed)
+        self.runtime = ThreadRuntime(self.config['trip_pool_size'])  # Replaced by SimulationEngine for virtual-time runs
+        self._task_seq = itertools.count()
         self.queues = {
-            TaskType.TRIP_MATCHING: queue.PriorityQueue(),
-            TaskType.PAYMENT: queue.Queue(),
-            TaskType.FEEDBACK: queue.Queue()
+            TaskType.TRIP_MATCHING: TripQueue(self.config[CAPACITY_KEYS[TaskType.TRIP_MATCHING]],
+                                              self.config['trip_ordering'],
+                                              self.config['priority_aging_rate'],
+                                              self.config['edf_deadline_step']),
+            TaskType.PAYMENT: queue.Queue(self.config[CAPACITY_KEYS[TaskType.PAYMENT]]),
+            TaskType.FEEDBACK: queue.Queue(self.config[CAPACITY_KEYS[TaskType.FEEDBACK]])
         }
-        self.riders = {}
-        self.customers = [f"Customer_{i}" for i in range(1, 41)]
-        self.customer_status = {}
+        self.riders = RiderStore()  # Integer rider ids; riders[i] is a view of row i
+        self.available_riders = GridIndex(self.config['grid_cell_size'])
+        self.roads = self._build_roads()  # None keeps straight-line distances and random trip lengths
+        self.customers = CustomerStore()
         self.lock = threading.Lock()
-        self.log_lock = threading.Lock()
-        self.metrics = {
-            'trip_busy': 0.0,
-            'trip_idle': 0.0,
-            'payment_busy': 0.0,
-            'payment_idle': 0.0,
-            'feedback_busy': 0.0,
-            'feedback_idle': 0.0,
-            'trip_response_times': [],
-            'throughput': 0,
-            'completed_trips': 0
-        }
+        # Lock waits are measured by wrapping the scheduler lock and the stores' lock stripes
+        self.instruments = Instruments() if self.config['instrumentation'] else None
+        if self.instruments:
+            self.lock, = self.instruments.watch('scheduler', [self.lock])
+            self.riders.locks = self.instruments.watch('rider', self.riders.locks)
+            self.customers.locks = self.instruments.watch('customer', self.customers.locks)
+            self.customers.mutex, = self.instruments.watch('customer_pool', [self.customers.mutex])
+        self.metrics = empty_metrics()
         self.running = False
-        self.logs = []
-        
-        for cust in self.customers:
-            self.customer_status[cust] = {
-                'status': 'idle',
-                'lock': threading.Lock(),
-                'location': (random.uniform(0, 100), random.uniform(0, 100))
-            }
+        self.generation = 0  # Bumped by reset(); deferred work from an older run is dropped
+        self.stopped = threading.Event()  # Set to end the current threaded run; start() makes a new one
+        self.worker_targets = {task_type: self.config[WORKER_KEYS[task_type]] for task_type in TaskType}
+        self.service_times = {task_type: None for task_type in TaskType}  # Smoothed seconds per item
+        self.stage_workers = {task_type: [] for task_type in TaskType}    # (thread, stop_event) per worker
+        self.retired_workers = []  # (thread, stop_event) retired by set_workers, joined by stop(wait=True)
+        self.worker_threads = []
+        self.autoscaler = Autoscaler(self) if self.config['autoscale'] else None
+        self.movement = RiderMovement(self) if self.config['rider_speed'] else None
+        self.arrival_backoff = 1.0
+        self.latency = LatencyRecorder(self.config['latency_window'])  # Per-stage latency histograms
+        self.rating_counts = [0] * 5  # Ratings given per star, index 0 is one star
+        self.demand = None if self.config['demand_rate'] is None else DemandGenerator(
+            self.config['demand_rate'], self.config['demand_profile'], self.config['demand_period'],
+            self.config['demand_hotspots'], self._subsystem_seed('demand_seed', 'demand'), self.config['demand_chunk'])
+        self.demand_origin = None  # Runtime time that demand time 0 maps to
+        self.shard = None  # sharding.Shard when this scheduler runs one region of a sharded simulation
+        self.events = EventLog(self.config['log_capacity'], self.config['log_level'],
+                               lambda customer: self.customers.name(customer),
+                               lambda rider: self.riders.name(rider))
+        self.trace = tracing.TraceWriter(self.config['trace_path'], self.config['trace_buffer']) \
+            if self.config['trace_path'] else None
+        self.snapshots = SnapshotPublisher(self, self.config['snapshot_interval'])
+
+        count = self.config['customer_count']
+        rng = self.np_rng['customers']
+        self.customers.add_many(rng.uniform(0, 100, count), rng.uniform(0, 100, count))
 
     def reset(self):
         with self.lock:
+            self.generation += 1
             for q in self.queues.values():
                 while not q.empty():
                     q.get()
-            self.metrics = {
-                'trip_busy': 0.0,
-                'trip_idle': 0.0,
-                'payment_busy': 0.0,
-                'payment_idle': 0.0,
-                'feedback_busy': 0.0,
-                'feedback_idle': 0.0,
-                'trip_response_times': [],
-                'throughput': 0,
-                'completed_trips': 0
-            }
-            self.logs = []
-            for rider in self.riders.values():
-                rider['status'] = 'available'
-                rider['feedback'] = []
-                rider['trips_completed'] = 0
-            for cust in self.customer_status.values():
-                cust['status'] = 'idle'
-
-    def add_rider(self, rider_id):
+            self.metrics = empty_metrics()
+            self.events.clear()
+            self.rng, self.np_rng = seeding.streams(self.seed)  # A reset run replays the same draws
+            if self.trace:  # Traces are append-only; a reset record starts the next run
+                self.trace.record(tracing.RESET, self.runtime.time())
+            self.arrival_backoff = 1.0
+            self.demand_origin = None
+            if self.demand:
+                self.demand.reset()
+            self.latency.clear()
+            if self.instruments:
+                self.instruments.clear()
+            self.rating_counts = [0] * 5
+            self.worker_targets = {task_type: self.config[WORKER_KEYS[task_type]] for task_type in TaskType}
+            self.service_times = {task_type: None for task_type in TaskType}
+            if self.autoscaler:
+                self.autoscaler.reset()
+            if self.movement:
+                self.movement.reset()
+            # Bulk resets are array operations on the stores
+            riders = self.riders
+            riders.trips[:riders.size] = 0
+            riders.clear_ratings()
+            riders.set_all('available')
+            self.customers.set_all('idle')
+            self.snapshots.invalidate()
+        # Available riders are already indexed at their current positions, so
+        # only the ones that were busy are added, and outside self.lock so
+        # matchers are not stalled by it
+        missing = np.setdiff1d(np.arange(riders.size), self.available_riders.ids(), assume_unique=True)
+        self.available_riders.insert_many(missing.tolist(), riders.x[missing].tolist(), riders.y[missing].tolist())
+
+    def add_rider(self, rider_id=None):
+        # Returns the rider's integer id; rider_id is kept as its display name
+        rng = self.rng['riders']
+        location = (rng.uniform(0, 100), rng.uniform(0, 100))
+        with self.lock:
+            index = self.riders.add(location, rider_id)
+            self.available_riders.insert(index, location)
+            return index
+
+    def add_riders(self, count):
+        # Bulk-adds `count` available riders at random locations; returns their id range
+        rng = self.np_rng['riders']
+        xs, ys = rng.uniform(0, 100, count), rng.uniform(0, 100, count)
         with self.lock:
-            self.riders[rider_id] = {
-                'status': 'available',
-                'location': (random.uniform(0, 100), random.uniform(0, 100)),
-                'feedback': [],
-                'trips_completed': 0,
-                'lock': threading.Lock()
-            }
+            ids = self.riders.add_many(xs, ys)
+            self.available_riders.insert_many(ids, xs.tolist(), ys.tolist())
+            return ids
+
+    def _set_rider_status(self, rider_id, status):
+        # Caller holds the rider's lock; keeps the spatial index limited to available riders
+        # (and, when sharded, to riders this shard owns)
+        if status == 'available':
+            self.riders.status[rider_id] = AVAILABLE
+            if self.shard is None or self.shard.owns(rider_id):
+                self.available_riders.insert(rider_id, self.riders.location(rider_id))
+        else:
+            self.riders.status[rider_id] = BUSY
+            self.available_riders.remove(rider_id)
+
+    def _build_roads(self):
+        config = self.config
+        options = dict(speed=config['road_speed'], landmarks=config['road_landmarks'],
+                       cache_size=config['route_cache_size'])
+        if config['road_network'] == 'grid':
+            return RoadNetwork.grid_city(config['road_spacing'], seed=self._subsystem_seed('road_seed', 'roads'), **options)
+        if config['road_network']:
+            return RoadNetwork.load(config['road_network'], **options)
+        return None
+
+    def _subsystem_seed(self, key, stream):
+        # The subsystem's own seed setting if given, else one derived from the master seed
+        seed = self.config[key]
+        return seeding.derive(self.seed, stream) if seed is None else seed
+
+    def manifest(self, **extra):
+        # Seed, config and environment of this run (see seeding.write_manifest)
+        return seeding.manifest(self.config, self.seed, riders=self.riders.size,
+                                customers=self.customers.size, **extra)
+
+    def snapshot(self):
+        # Immutable summary for dashboard readers (snapshot.Snapshot), refreshed at most once per snapshot_interval
+        return self.snapshots.get()
+
+    def fleet_snapshot(self):
+        # Read-only per-rider columns (snapshot.FleetSnapshot), refreshed like snapshot()
+        return self.snapshots.get_fleet()
+
+    def rider_rating(self, rider_id, default=0.0):
+        # Average stars of one rider, decayed when rating_half_life is set
+        return float(self.riders.ratings([rider_id], self.config['rating_half_life'], default)[0])
+
+    def rider_ratings(self, default=0.0):
+        # Array of every rider's average stars, indexed by rider id
+        return self.riders.ratings(None, self.config['rating_half_life'], default)
 
     def _calculate_distance(self, point1, point2):
         return math.sqrt((point1[0]-point2[0])**2 + (point1[1]-point2[1])**2)
 
     def _get_best_rider(self, customer_loc):
-        min_distance = float('inf')
-        candidate_riders = []
-        
-        # First pass: Find minimum distance
-        for rider_id, rider in self.riders.items():
-            with rider['lock']:
-                if rider['status'] != 'available':
-                    continue
-                distance = self._calculate_distance(customer_loc, rider['location'])
-                if distance < min_distance:
-                    min_distance = distance
-                    candidate_riders = [(rider_id, rider)]
-                elif distance == min_distance:
-                    candidate_riders.append((rider_id, rider))
-
-        if not candidate_riders:
+        # First pass: Nearest available riders from the spatial index, by network
+        # ETA among the closest few when a road network is configured
+        if self.roads:
+            nearby = self.available_riders.k_nearest(customer_loc, self.config['eta_candidates'],
+                                                     self.config['max_search_radius'])
+            if self.shard:
+                # Riders just across a region border may be closer than any local one
+                nearby = self.shard.widen_k(customer_loc, self.config['eta_candidates'], nearby)
+            nearby = [rider_id for _, rider_id in nearby]
+            etas = [self.roads.eta(self.riders.location(rider_id), customer_loc) for rider_id in nearby]
+            best_eta = min(etas, default=None)
+            nearest_ids = [rider_id for rider_id, eta in zip(nearby, etas) if eta == best_eta]
+        else:
+            best, nearest_ids = self.available_riders.nearest(customer_loc, self.config['max_search_radius'])
+            if self.shard:
+                # Riders just across a region border may be closer than any local one
+                nearest_ids = self.shard.widen(customer_loc, best, nearest_ids)
+
+        if not nearest_ids:
             return None
 
         # Second pass: Evaluate feedback and trips for closest riders
-        best_score = -1
-        best_rider_id = None
-        for rider_id, rider in candidate_riders:
-            avg_feedback = (sum(rider['feedback']))/len(rider['feedback']) if rider['feedback'] else 3.0
-            trips = rider['trips_completed']
-            score = (avg_feedback * 0.7) + (trips * 0.3)
-            if score > best_score:
-                best_score = score
-                best_rider_id = rider_id
-
-        return best_rider_id
-
-    def add_task(self, task_type, priority, task):
+        candidates = np.asarray(nearest_ids, dtype=np.int64)
+        avg_feedback = self.riders.ratings(candidates, self.config['rating_half_life'], 3.0)
+        trips = self.riders.trips[candidates]
+        score = (avg_feedback * 0.7) + (trips * 0.3)
+        return int(candidates[np.argmax(score)])  # First of equal scores, as before
+
+    def _reserve_rider(self, rider_id):
+        # Compare-and-set available -> busy under the rider's lock stripe.
+        # Returns False if another matcher reserved the rider first.
+        with self.riders.lock_for(rider_id):
+            if self.riders.status[rider_id] != AVAILABLE:
+                return False
+            self._set_rider_status(rider_id, 'busy')
+            if self.shard:
+                self.shard.take_ownership(rider_id)
+            return True
+
+    def _claim_best_rider(self, customer_loc):
+        # Picks and reserves the best rider in one step, picking again when a
+        # concurrent matcher wins the reservation; None if no rider could be claimed
+        attempts = self.config['reservation_attempts']
+        for attempt in range(attempts):
+            rider_id = self._get_best_rider(customer_loc)
+            if rider_id is None:
+                return None
+            if self._reserve_rider(rider_id):
+                return rider_id
+            with self.lock:
+                self.metrics['reservation_conflicts'] += 1
+                if attempt + 1 < attempts:
+                    self.metrics['reservation_retries'] += 1
+        return None
+
+    def add_task(self, task_type, priority, task, submitted_at=None):
+        # Returns False if the task was dropped because its queue stayed full.
+        # Every task is a partial whose first argument is the customer it serves.
+        # submitted_at lets a retried trip request keep its original request time.
+        task_queue = self.queues[task_type]
         if task_type == TaskType.TRIP_MATCHING:
-            self.queues[task_type].put((priority, time.time(), task))
+            # The sequence number keeps FIFO order among equal (priority, time) entries
+            enqueued_at = self.runtime.time() if submitted_at is None else submitted_at
+            entry = (priority, enqueued_at, next(self._task_seq), task)
         else:
-            self.queues[task_type].put(task)
+            entry = task
+        try:
+            task_queue.put_nowait(entry)
+            self._enqueued(task_type, entry)
+            return True
+        except queue.Full:
+            pass
 
-    def process_trip_matching_tasks(self):
-        while self.running:
-            start_time = time.time()
-            if not self.queues[TaskType.TRIP_MATCHING].empty():
-                time.sleep(0.7)  # Increased processing time
-                _, _, task = self.queues[TaskType.TRIP_MATCHING].get()
-                task()
-                self.metrics['trip_busy'] += time.time() - start_time
+        with self.lock:
+            self.metrics['queue_full'] += 1
+        policy = self.config['overload_policy']
+        if policy == 'block' and self.runtime.can_block:
+            try:
+                task_queue.put(entry, timeout=self.config['block_timeout'])
+                self._enqueued(task_type, entry)
+                return True
+            except queue.Full:
+                pass
+        elif policy == 'shed' and task_type == TaskType.TRIP_MATCHING:
+            shed = task_queue.pop_worst(entry)
+            if shed is not None:
+                self._drop_task(task_type, shed[3], 'shed')
+                try:
+                    task_queue.put_nowait(entry)
+                    self._enqueued(task_type, entry)
+                    return True
+                except queue.Full:
+                    pass
+        self._drop_task(task_type, task, 'dropped')
+        return False
+
+    def add_tasks(self, task_type, priorities, tasks, submitted_at=None):
+        # Bulk add_task: trip requests enter the queue under one lock acquisition
+        # and only the overflow goes through the overload policy one at a time.
+        # Returns how many tasks were queued.
+        if task_type != TaskType.TRIP_MATCHING:
+            return sum(self.add_task(task_type, priority, task) for priority, task in zip(priorities, tasks))
+        if submitted_at is None:
+            submitted_at = [self.runtime.time()] * len(tasks)
+        entries = [(priority, enqueued_at, next(self._task_seq), task)
+                   for priority, enqueued_at, task in zip(priorities, submitted_at, tasks)]
+        queued = self.queues[task_type].put_many(entries)
+        if self.trace:
+            for entry in entries[:queued]:
+                self._enqueued(task_type, entry)
+        for priority, enqueued_at, _, task in entries[queued:]:
+            queued += self.add_task(task_type, priority, task, enqueued_at)
+        return queued
+
+    def _drop_task(self, task_type, task, outcome):
+        customer = task.args[0]
+        with self.lock:
+            self.metrics[outcome] += 1
+        now = self.runtime.time()
+        if self.trace:
+            self.trace.record(tracing.KIND_CODES[outcome], now, customer, stage=task_type.value)
+        self.events.emit(outcome, now, customer, detail=task_type.name.replace('_', ' ').title())
+        self.customers.release(customer)
+
+    def _service_time(self, task_type):
+        service_time = self.config[SERVICE_TIME_KEYS[task_type]]
+        if task_type == TaskType.TRIP_MATCHING and self.config['matching_mode'] == 'batch':
+            service_time += self.config['batch_window']  # Paid once per batch
+        return service_time
+
+    def _enqueued(self, task_type, entry):
+        # Called once an item is in its queue
+        if self.trace:
+            if task_type == TaskType.TRIP_MATCHING:
+                self.trace.record(tracing.ENQUEUE, entry[1], entry[3].args[0], stage=task_type.value, priority=entry[0])
             else:
-                time.sleep(0.1)
+                self.trace.record(tracing.ENQUEUE, self.runtime.time(), entry.args[0], stage=task_type.value)
+
+    def _dequeued(self, task_type, entry):
+        # Called by both runtimes as soon as an item leaves its queue
+        now = self.runtime.time()
+        if task_type == TaskType.TRIP_MATCHING:
+            priority, enqueued_at = entry[0], entry[1]
+            customer = entry[3].args[0]
+            # A request's wait is recorded once, at its first dequeue and under
+            # the class it arrived with; retries re-queue at priority 2 with the
+            # original request time and would count the same wait again
+            wait_class = int(self.customers.wait_class[customer])
+            if wait_class:
+                self.customers.wait_class[customer] = 0
+                self.latency.record('queue_wait', now - enqueued_at, now, wait_class)
+                if self.instruments:
+                    self.instruments.observe('queue_wait', 'trip_matching', now - enqueued_at)
+            if self.trace:
+                self.trace.record(tracing.DEQUEUE, now, entry[3].args[0], value=now - enqueued_at,
+                                  stage=task_type.value, priority=priority)
+            return
+        customer = entry.args[0]
+        if self.instruments:
+            # Payment and feedback items are queued when the customer's stage clock restarts
+            enqueued_at = self.customers.stage_started_at[customer]
+            if enqueued_at == enqueued_at:  # Not NaN
+                self.instruments.observe('queue_wait', task_type.name.lower(), now - enqueued_at)
+        if self.trace:
+            self.trace.record(tracing.DEQUEUE, now, customer, stage=task_type.value)
+
+    def queue_wait_percentiles(self, percentiles=(50, 95, 99)):
+        # {priority: {p: seconds}} over the rolling latency window of each trip priority class
+        return self.latency.priority_percentiles(self.runtime.time(), percentiles)
+
+    def _run_task(self, task_type, entry):
+        # Runs an item already taken off its stage queue; shared by the threaded
+        # workers and the simulation engine
+        if task_type != TaskType.TRIP_MATCHING:
+            entry()
+        elif self.config['matching_mode'] == 'batch':
+            # Top the batch up with whatever else is queued by now
+            batch = [entry]
+            while len(batch) < self.config['batch_size']:
+                try:
+                    queued = self.queues[task_type].get_nowait()
+                except queue.Empty:
+                    break
+                self._dequeued(task_type, queued)
+                batch.append(queued)
+            # Trip matching tasks are partials of _simulate_trip(customer)
+            self._match_batch([task.args[0] for _, _, _, task in batch])
+        else:
+            _, _, _, task = entry
+            task()
+
+    def _add_stage_time(self, metric, elapsed):
+        with self.lock:
+            self.metrics[metric] += elapsed
+
+    def _record_service(self, task_type, elapsed):
+        if self.instruments:
+            self.instruments.observe('service', task_type.name.lower(), elapsed)
+        with self.lock:
+            self.metrics[BUSY_METRICS[task_type]] += elapsed
+            average = self.service_times[task_type]
+            self.service_times[task_type] = elapsed if average is None else \
+                average + SERVICE_TIME_SMOOTHING * (elapsed - average)
+
+    def _process_tasks(self, task_type, stop_event):
+        task_queue = self.queues[task_type]
+        idle_metric = IDLE_METRICS[task_type]
+        while self.running and not stop_event.is_set():
+            wait_start = self.runtime.time()
+            try:
+                entry = task_queue.get(timeout=WORKER_POLL_TIMEOUT)
+            except queue.Empty:
+                self._add_stage_time(idle_metric, self.runtime.time() - wait_start)
+                continue
+            self._dequeued(task_type, entry)
+            start_time = self.runtime.time()
+            self._add_stage_time(idle_metric, start_time - wait_start)
+            generation = self.generation
+            self.runtime.sleep(self._service_time(task_type))
+            # An item in service at a reset is neither run nor counted in the new run
+            self._run_if_current(generation, partial(self._run_task, task_type, entry))
+            self._run_if_current(generation, partial(self._record_service, task_type,
+                                                     self.runtime.time() - start_time))
+
+    def _start_worker(self, task_type):
+        stop_event = threading.Event()
+        thread = threading.Thread(target=self._process_tasks, args=(task_type, stop_event),
+                                  name=f"{task_type.name.lower()}-{len(self.stage_workers[task_type])}")
+        self.stage_workers[task_type].append((thread, stop_event))
+        thread.start()
+
+    def set_workers(self, task_type, count):
+        # Resizes a stage's worker pool. Retired threads finish their current
+        # item first; the simulation engine reads worker_targets directly.
+        with self.lock:
+            self.worker_targets[task_type] = count
+            if not self.running or not self.worker_threads:
+                return
+            workers = self.stage_workers[task_type]
+            self.retired_workers = [worker for worker in self.retired_workers if worker[0].is_alive()]
+            while len(workers) > count:
+                worker = workers.pop()
+                worker[1].set()
+                self.retired_workers.append(worker)
+            while len(workers) < count:
+                self._start_worker(task_type)
+
+    def process_trip_matching_tasks(self):
+        self._process_tasks(TaskType.TRIP_MATCHING, threading.Event())
 
     def process_payment_tasks(self):
-        while self.running:
-            start_time = time.time()
-            if not self.queues[TaskType.PAYMENT].empty():
-                time.sleep(0.5)  # Increased processing time
-                task = self.queues[TaskType.PAYMENT].get()
-                task()
-                self.metrics['payment_busy'] += time.time() - start_time
-            else:
-                time.sleep(0.1)
+        self._process_tasks(TaskType.PAYMENT, threading.Event())
 
     def process_feedback_tasks(self):
-        while self.running:
-            start_time = time.time()
-            if not self.queues[TaskType.FEEDBACK].empty():
-                time.sleep(0.3)  # Increased processing time
-                task = self.queues[TaskType.FEEDBACK].get()
-                task()
-                self.metrics['feedback_busy'] += time.time() - start_time
+        self._process_tasks(TaskType.FEEDBACK, threading.Event())
+
+    def start(self):
+        # Starts the configured number of consumer threads per stage plus the
+        # arrival generator (and autoscaler, rider movement). A previous run's
+        # threads are stopped and joined first, so there is only ever one
+        # generation of them.
+        self.stop(wait=True)
+        with self.lock:
+            self.running = True
+            self.stopped = threading.Event()
+            self.stage_workers = {task_type: [] for task_type in TaskType}
+            for task_type in TaskType:
+                for _ in range(self.worker_targets[task_type]):
+                    self._start_worker(task_type)
+            self.worker_threads = [threading.Thread(target=self.simulate_task_arrivals, args=(self.stopped,),
+                                                    name='arrivals')]
+            if self.autoscaler:
+                self.worker_threads.append(threading.Thread(target=self.autoscaler.run, args=(self.stopped,),
+                                                            name='autoscaler'))
+            if self.movement:
+                self.worker_threads.append(threading.Thread(target=self.movement.run, args=(self.stopped,),
+                                                            name='movement'))
+            for thread in self.worker_threads:
+                thread.start()
+
+    def stop(self, wait=False):
+        # Signals every thread of the current run; with wait, also joins them
+        # (a worker first finishes the item it is serving)
+        with self.lock:
+            self.running = False
+            self.stopped.set()
+            for workers in self.stage_workers.values():
+                for _, stop_event in workers:
+                    stop_event.set()
+        if wait:
+            for thread in self.worker_threads:
+                thread.join()
+            for workers in [*self.stage_workers.values(), self.retired_workers]:
+                for thread, _ in workers:
+                    thread.join()
+            self.retired_workers = []
+        if self.trace:
+            self.trace.flush()
+
+    def _match_batch(self, customers):
+        # customers arrive in queue order (most urgent first), which assign_batch
+        # uses to decide who is left over when riders run short
+        start_time = self.runtime.time()
+        self.events.emit('batch', start_time, value=len(customers))
+        radius = self.config['max_search_radius']
+        customer_locs = self.customers.locations(customers)
+        rider_ids = []
+        seen = set()
+        for loc in customer_locs:
+            for _, rider_id in self.available_riders.k_nearest(tuple(loc), self.config['batch_candidates'], radius):
+                if rider_id not in seen:
+                    seen.add(rider_id)
+                    rider_ids.append(rider_id)
+        rider_locs = self.riders.locations(rider_ids)
+        etas = self.roads.eta_matrix(customer_locs, rider_locs) if self.roads and rider_ids else None
+        assignment = assign_batch(customer_locs, rider_locs, radius, etas)
+
+        for customer, col in zip(customers, assignment):
+            rider_id = rider_ids[col] if col >= 0 else None
+            if rider_id is not None and not self._reserve_rider(rider_id):
+                # Lost the rider to a concurrent matcher since the batch was solved
+                with self.lock:
+                    self.metrics['reservation_conflicts'] += 1
+                    self.metrics['reservation_retries'] += 1
+                rider_id = self._claim_best_rider(self.customers.location(customer))
+            if rider_id is not None:
+                self._assign_rider(customer, rider_id, start_time)
+                self._start_trip(customer, rider_id)
             else:
-                time.sleep(0.1)
+                self._retry_trip(customer)
+
+    def _current_run(self, fn):
+        # Ties deferred work (pool tasks, timers, holds) to the run that
+        # scheduled it, so callbacks still pending at a reset never fire
+        return partial(self._run_if_current, self.generation, fn)
+
+    def _run_if_current(self, generation, fn):
+        if generation == self.generation:
+            fn()
 
     def _simulate_trip(self, customer):
-        def execute_trip():
-            start_time = time.time()
-            with self.log_lock:
-                self.logs.append(f"🚗 [{customer}] Searching for rider...")
-            
-            customer_loc = self.customer_status[customer]['location']
-            best_rider = self._get_best_rider(customer_loc)
-            
-            if best_rider:
-                response_time = time.time() - start_time
-                self.metrics['trip_response_times'].append(response_time)
-                self.metrics['throughput'] += 1
-                with self.riders[best_rider]['lock']:
-                    self.riders[best_rider]['status'] = 'busy'
-                with self.log_lock:
-                    self.logs.append(f"✅ [{customer}] Matched with {best_rider} in {response_time:.3f}s")
-                
-                trip_duration = random.uniform(3.0, 8.0)
-                time.sleep(trip_duration)
-                
-                with self.riders[best_rider]['lock']:
-                    self.riders[best_rider]['status'] = 'available'
-                    self.riders[best_rider]['trips_completed'] += 1
-                with self.log_lock:
-                    self.logs.append(f"🏁 [{customer}] Trip completed ({trip_duration:.1f}s) → Processing payment")
-                self.add_task(TaskType.PAYMENT, 0, lambda: self._process_payment(customer, best_rider))
-            else:
-                with self.log_lock:
-                    self.logs.append(f"⚠️ [{customer}] No riders available. Retrying...")
-                time.sleep(0.5)
-                self.add_task(TaskType.TRIP_MATCHING, 2, lambda: self._simulate_trip(customer))
+        self.runtime.spawn(self._current_run(partial(self._execute_trip, customer)))
+
+    def _execute_trip(self, customer):
+        start_time = self.runtime.time()
+        self.events.emit('searching', start_time, customer)
         
-        threading.Thread(target=execute_trip).start()
+        customer_loc = self.customers.location(customer)
+        best_rider = self._claim_best_rider(customer_loc)
+        
+        if best_rider is not None:
+            self._assign_rider(customer, best_rider, start_time)
+            self._start_trip(customer, best_rider)
+        else:
+            self._retry_trip(customer)
+
+    def _assign_rider(self, customer, rider_id, start_time):
+        # The rider is already reserved by the caller
+        now = self.runtime.time()
+        response_time = now - start_time
+        self.latency.record('match', response_time, now)
+        with self.lock:
+            self.metrics['throughput'] += 1
+        if self.trace:
+            self.trace.record(tracing.MATCH, now, customer, rider_id, response_time)
+        self.events.emit('matched', now, customer, rider_id, response_time)
+
+    def _start_trip(self, customer, rider_id):
+        with self.lock:
+            self.metrics['in_flight_trips'] += 1
+        if self.trace:
+            self.trace.record(tracing.TRIP_START, self.runtime.time(), customer, rider_id)
+        if self.movement:
+            # The trip completes when the rider reaches the drop-off
+            self.movement.begin_trip(rider_id, customer, self.runtime.time())
+            return
+        trip_duration = self._trip_duration(customer, rider_id)
+        self.runtime.call_later(trip_duration,
+                                self._current_run(partial(self._complete_trip, customer, rider_id, trip_duration)))
+
+    def _trip_duration(self, customer, rider_id):
+        # Pickup ETA plus the ride to a random drop-off over the road network
+        if not self.roads:
+            return self.rng['trips'].uniform(*self.config['trip_duration'])
+        pickup = self.customers.location(customer)
+        dropoff = (self.rng['trips'].uniform(0, 100), self.rng['trips'].uniform(0, 100))
+        return self.roads.eta(self.riders.location(rider_id), pickup) + self.roads.eta(pickup, dropoff)
+
+    def _complete_trip(self, customer, rider_id, trip_duration):
+        with self.lock:
+            self.metrics['in_flight_trips'] -= 1
+        with self.riders.lock_for(rider_id):
+            self.riders.trips[rider_id] += 1
+            self._set_rider_status(rider_id, 'available')
+        now = self.runtime.time()
+        if self.trace:
+            self.trace.record(tracing.TRIP_END, now, customer, rider_id, trip_duration)
+        self.events.emit('trip_completed', now, customer, rider_id, trip_duration)
+        self.customers[customer].stage_started_at = now
+        self.add_task(TaskType.PAYMENT, 0, partial(self._process_payment, customer, rider_id))
+
+    def _retry_trip(self, customer):
+        self.events.emit('no_rider', self.runtime.time(), customer)
+        # The retry keeps its original request time so aging and deadlines keep counting
+        self.runtime.call_later(self.config['retry_delay'], self._current_run(
+            partial(self.add_task, TaskType.TRIP_MATCHING, 2, partial(self._simulate_trip, customer),
+                    submitted_at=self.customers[customer].requested_at)))
 
     def _process_payment(self, customer, rider):
-        with self.log_lock:
-            self.logs.append(f"💸 [{customer}] Processing payment...")
-        
-        payment_time = random.uniform(0.5, 1.5)
-        time.sleep(payment_time)
+        self.events.emit('payment_started', self.runtime.time(), customer, rider)
         
-        with self.log_lock:
-            self.logs.append(f"✅ [{customer}] Payment processed ({payment_time:.1f}s) → Collecting feedback")
+        payment_time = self.rng['payments'].uniform(*self.config['payment_duration'])
+        self.runtime.hold(payment_time, self._current_run(partial(self._finish_payment, customer, rider, payment_time)))
+
+    def _finish_payment(self, customer, rider, payment_time):
+        self._record_stage_latency('payment', customer)
+        now = self.runtime.time()
+        if self.trace:
+            self.trace.record(tracing.PAYMENT, now, customer, rider, payment_time)
+        self.events.emit('payment_done', now, customer, rider, payment_time)
+        with self.lock:
             self.metrics['completed_trips'] += 1
-        self.add_task(TaskType.FEEDBACK, 0, lambda c=customer, r=rider: self._collect_feedback(c, r))
+        self.add_task(TaskType.FEEDBACK, 0, partial(self._collect_feedback, customer, rider))
 
     def _collect_feedback(self, customer, rider):
-        with self.log_lock:
-            self.logs.append(f"🌟 [{customer}] Collecting feedback...")
+        self.events.emit('feedback_started', self.runtime.time(), customer, rider)
         
-        time.sleep(0.5)
-        feedback = random.choices([1, 2, 3, 4, 5], weights=[1, 2, 3, 4, 5])[0]
+        self.runtime.hold(self.config['feedback_duration'],
+                          self._current_run(partial(self._record_feedback, customer, rider)))
+
+    def _record_stage_latency(self, stage, customer):
+        # Time from the stage's task being queued to its completion; restarts the clock for the next stage
+        now = self.runtime.time()
+        status = self.customers[customer]
+        started = status.stage_started_at
+        if started is not None:
+            self.latency.record(stage, now - started, now)
+        status.stage_started_at = now
+
+    def _record_feedback(self, customer, rider):
+        self._record_stage_latency('feedback', customer)
+        feedback = self.rng['feedback'].choices([1, 2, 3, 4, 5], weights=[1, 2, 3, 4, 5])[0]
         
-        with self.riders[rider]['lock']:
-            self.riders[rider]['feedback'].append(feedback)
-        with self.log_lock:
-            self.logs.append(f"⭐ [{customer}] Gave {feedback} stars to {rider}")
-        with self.customer_status[customer]['lock']:
-            self.customer_status[customer]['status'] = 'idle'
-
-    def simulate_task_arrivals(self):
-        while self.running:
-            if random.random() < 0.9:  # Higher probability
-                available_customers = [cust for cust in self.customers 
-                                    if self.customer_status[cust]['status'] == 'idle']
-                if available_customers:
-                    customer = random.choice(available_customers)
-                    with self.customer_status[customer]['lock']:
-                        self.customer_status[customer]['status'] = 'in_trip'
-                    self.add_task(TaskType.TRIP_MATCHING, random.randint(1, 5), lambda c=customer: self._simulate_trip(c))
-            time.sleep(random.uniform(0.1, 0.3))  # Shorter interval
\ No newline at end of file
+        with self.riders.lock_for(rider):
+            self.riders.add_rating(rider, feedback, self.runtime.time(), self.config['rating_half_life'])
+        with self.lock:
+            self.rating_counts[feedback - 1] += 1
+        now = self.runtime.time()
+        if self.trace:
+            self.trace.record(tracing.FEEDBACK, now, customer, rider, feedback)
+        self.events.emit('rated', now, customer, rider, feedback)
+        self.customers.release(customer)
+
+    def _arrival_tick(self):
+        # Returns False if the new trip request was rejected
+        rng = self.rng['arrivals']
+        if rng.random() < self.config['arrival_probability']:
+            # Sampling an idle customer also marks them in_trip, so two arrival
+            # ticks can never pick the same customer
+            customer = self.customers.claim_random_idle(rng)
+            if customer is not None:
+                now = self.runtime.time()
+                priority = rng.randint(1, 5)
+                with self.customers.lock_for(customer):
+                    self.customers[customer].requested_at = now
+                    self.customers.wait_class[customer] = priority
+                if self.trace:
+                    self.trace.record(tracing.ARRIVAL, now, customer, priority=priority)
+                return self.add_task(TaskType.TRIP_MATCHING, priority, partial(self._simulate_trip, customer))
+        return True
+
+    def _demand_tick(self):
+        # Releases every generated request due by now in one bulk submission.
+        # Each request is served by an idle customer moved to its origin;
+        # requests with nobody idle are counted as unserved. Returns False if
+        # the queue rejected any of them.
+        now = self.runtime.time()
+        if self.demand_origin is None:
+            self.demand_origin = now
+        times, xs, ys, priorities = self.demand.take(now - self.demand_origin)
+        if not len(times):
+            return True
+        batch_priorities, tasks, submitted_at = [], [], []
+        for t, x, y, priority in zip(times.tolist(), xs.tolist(), ys.tolist(), priorities.tolist()):
+            customer = self.customers.claim_random_idle(self.rng['arrivals'])
+            if customer is None:
+                with self.lock:
+                    self.metrics['unserved'] += len(times) - len(tasks)
+                break
+            with self.customers.lock_for(customer):
+                self.customers.x[customer], self.customers.y[customer] = x, y
+                self.customers[customer].requested_at = self.demand_origin + t
+                self.customers.wait_class[customer] = priority
+            if self.trace:
+                self.trace.record(tracing.ARRIVAL, self.demand_origin + t, customer, priority=priority)
+            batch_priorities.append(priority)
+            tasks.append(partial(self._simulate_trip, customer))
+            submitted_at.append(self.demand_origin + t)
+        return self.add_tasks(TaskType.TRIP_MATCHING, batch_priorities, tasks, submitted_at) == len(tasks)
+
+    def _arrival_step(self):
+        # One step of the arrival process; returns the seconds until the next step
+        if self.demand:
+            self._update_backoff(self._demand_tick())
+            tick = self.config['demand_tick']
+            # The demand clock stands still for the stretched part of the gap,
+            # so rejections postpone requests instead of bunching them up
+            self.demand_origin += tick * (self.arrival_backoff - 1)
+            return tick * self.arrival_backoff
+        return self._next_arrival_gap(self._arrival_tick())
+
+    def _update_backoff(self, accepted):
+        # Rejections double the backoff factor (up to arrival_backoff_max) so
+        # the generator throttles itself while matching is behind
+        if accepted:
+            self.arrival_backoff = 1.0
+        else:
+            self.arrival_backoff = min(self.arrival_backoff * 2, self.config['arrival_backoff_max'])
+
+    def _next_arrival_gap(self, accepted):
+        self._update_backoff(accepted)
+        return self.rng['arrivals'].uniform(*self.config['arrival_interval']) * self.arrival_backoff
+
+    def simulate_task_arrivals(self, stopped=None):
+        stopped = stopped or threading.Event()
+        while self.running and not stopped.is_set():
+            stopped.wait(self._arrival_step())
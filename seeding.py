@@ -0,0 +1,58 @@
+import json, platform, random, subprocess, sys, time
+import numpy as np
+
+# Independent random streams, one per subsystem, so that a change in how
+# often one subsystem draws never shifts the numbers another one sees
+STREAMS = ('customers', 'riders', 'arrivals', 'trips', 'payments', 'feedback', 'movement', 'demand', 'roads')
+
+
+def resolve_seed(seed):
+    # A run without a seed still gets a concrete one, so it can be recorded and replayed
+    return int(np.random.SeedSequence().entropy) if seed is None else seed
+
+
+def derive(seed, name):
+    # Integer seed of one named stream; seed is an int or a sequence of ints
+    key = [seed] if isinstance(seed, int) else list(seed)
+    return int(np.random.SeedSequence(key + [STREAMS.index(name)]).generate_state(1, np.uint64)[0])
+
+
+def streams(seed):
+    # ({name: random.Random}, {name: numpy Generator}); scalar draws use the
+    # former, bulk array draws the latter
+    seeds = {name: derive(seed, name) for name in STREAMS}
+    return ({name: random.Random(value) for name, value in seeds.items()},
+            {name: np.random.default_rng(value) for name, value in seeds.items()})
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def manifest(config, seed, **extra):
+    # Everything needed to repeat a run: seed, full config, code revision and versions
+    return dict({
+        'seed': seed,
+        'config': config,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_revision': _git_revision(),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform()
+    }, **extra)
+
+
+def write_manifest(path, config, seed, **extra):
+    with open(path, 'w') as f:
+        json.dump(manifest(config, seed, **extra), f, indent=2, default=str)
+
+
+def load_manifest(path):
+    # (config, seed) of a recorded run, ready for Scheduler(dict(config, seed=seed))
+    with open(path) as f:
+        data = json.load(f)
+    return data['config'], data['seed']
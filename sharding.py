@@ -0,0 +1,408 @@
+import math, threading, queue, multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from fleet import RiderStore, CustomerStore, LOCK_STRIPES, AVAILABLE
+from movement import PARKED, CRUISING
+from latency import LatencyRecorder
+from scheduler import Scheduler, TaskType, DEFAULT_CONFIG, empty_metrics
+from engine import SimulationEngine
+from event_log import EventLog
+from snapshot import SnapshotPublisher
+import seeding
+
+
+def region_of(xs, ys, regions):
+    # Region index of each point for a (columns, rows) split of the 100x100 plane
+    columns, rows = regions
+    column = np.clip((np.asarray(xs) * columns // 100).astype(np.int64), 0, columns - 1)
+    row = np.clip((np.asarray(ys) * rows // 100).astype(np.int64), 0, rows - 1)
+    return row * columns + column
+
+
+def region_bounds(region, regions):
+    # (x_low, y_low, x_high, y_high) of one region
+    columns, rows = regions
+    width, height = 100.0 / columns, 100.0 / rows
+    column, row = region % columns, region // columns
+    return (column * width, row * height, (column + 1) * width, (row + 1) * height)
+
+
+class SharedRiderStore(RiderStore):
+    # RiderStore whose columns live in one shared-memory block of fixed
+    # capacity, with the size in a shared header and process-shared lock
+    # stripes, so every shard process reads and reserves the same fleet.
+    # Rider names stay in the creating process.
+    columns = dict(RiderStore.columns, owner=np.int16)  # Region that matches, drives and indexes the rider
+
+    def __init__(self, capacity, locks, name=None):
+        layout, offset = {}, 8  # The header holds the size
+        for column, dtype in self.columns.items():
+            offset = -(-offset // 8) * 8
+            layout[column] = offset
+            offset += np.dtype(dtype).itemsize * capacity
+        # Shard processes share their parent's resource tracker, so only the
+        # creator's close(unlink=True) removes the block
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=offset)
+        self.capacity = capacity
+        self._header = np.ndarray(1, np.int64, self.memory.buf, 0)
+        for column, dtype in self.columns.items():
+            setattr(self, column, np.ndarray(capacity, dtype, self.memory.buf, layout[column]))
+        self.labels = {}
+        self.ids = {}
+        self.locks = locks
+        self.mutex = threading.Lock()
+
+    @property
+    def size(self):
+        return int(self._header[0])
+
+    @size.setter
+    def size(self, value):
+        self._header[0] = value
+
+    def attach_args(self):
+        # Arguments that let another process open the same store
+        return (self.capacity, self.locks, self.memory.name)
+
+    def _reserve(self, count):
+        if self.size + count > self.capacity:
+            raise ValueError(f"Shared rider store is full ({self.capacity} riders)")
+
+    def close(self, unlink=False):
+        for column in self.columns:
+            setattr(self, column, None)
+        self._header = None
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+class Shard:
+    # One region's side of the cross-border protocol. The shared status array
+    # is the truth and reservations are compare-and-set under the shared lock
+    # stripes; each shard's spatial index only caches the available riders it
+    # owns and is reconciled on every sync:
+    #   - a successful reservation moves ownership to the reserving region,
+    #     which then drives the trip and gets the rider back when it ends;
+    #   - idle riders standing in another region are handed to that region;
+    #   - available riders owned by neighbours within `border_band` of this
+    #     region are snapshotted, so a request near the border can pick a
+    #     closer rider across it (a stale pick just loses the CAS and retries).
+    def __init__(self, scheduler, region, regions):
+        self.scheduler = scheduler
+        self.region = region
+        self.regions = regions
+        self.bounds = region_bounds(region, regions)
+        self.border_band = scheduler.config['shard_border_band']
+        self.remote = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+        self.handoffs = 0
+
+    def owns(self, rider_id):
+        return self.scheduler.riders.owner[rider_id] == self.region
+
+    def owned(self, n):
+        return self.scheduler.riders.owner[:n] == self.region
+
+    def take_ownership(self, rider_id):
+        # Caller holds the rider's lock stripe
+        self.scheduler.riders.owner[rider_id] = self.region
+
+    def border_distance(self, loc):
+        # Distance to the nearest edge shared with another region
+        x_low, y_low, x_high, y_high = self.bounds
+        edges = [loc[0] - x_low if x_low > 0 else math.inf, x_high - loc[0] if x_high < 100 else math.inf,
+                 loc[1] - y_low if y_low > 0 else math.inf, y_high - loc[1] if y_high < 100 else math.inf]
+        return min(edges)
+
+    def widen(self, loc, best, nearest_ids):
+        # Adds border riders from the neighbour snapshot that beat or tie the local best
+        ids, xs, ys = self.remote
+        if not len(ids) or self.border_distance(loc) >= best:
+            return nearest_ids
+        distances = np.hypot(xs - loc[0], ys - loc[1])
+        radius = self.scheduler.config['max_search_radius']
+        closest = distances.min()
+        if closest > best or (radius is not None and closest > radius):
+            return nearest_ids
+        remote_ids = ids[distances == closest].tolist()
+        return remote_ids if closest < best else list(nearest_ids) + remote_ids
+
+    def widen_k(self, loc, k, nearest):
+        # k_nearest counterpart of widen: merges border riders from the
+        # neighbour snapshot into the local (distance, rider_id) pairs and
+        # returns the k closest
+        ids, xs, ys = self.remote
+        if not len(ids) or (len(nearest) == k and self.border_distance(loc) >= nearest[-1][0]):
+            return nearest
+        distances = np.hypot(xs - loc[0], ys - loc[1])
+        radius = self.scheduler.config['max_search_radius']
+        close = np.flatnonzero(distances <= radius) if radius is not None else np.arange(len(ids))
+        if len(close) > k:
+            close = close[np.argpartition(distances[close], k)[:k]]
+        merged = dict((rider_id, distance) for distance, rider_id in nearest)
+        for distance, rider_id in zip(distances[close].tolist(), ids[close].tolist()):
+            merged.setdefault(rider_id, distance)
+        return sorted((distance, rider_id) for rider_id, distance in merged.items())[:k]
+
+    def sync(self):
+        scheduler = self.scheduler
+        riders, index = scheduler.riders, scheduler.available_riders
+        n = riders.size
+        mine = self.owned(n)
+
+        # Hand idle riders standing outside the region to the region they are in
+        regions = region_of(riders.x[:n], riders.y[:n], self.regions)
+        phase = riders.phase[:n]
+        leaving = np.flatnonzero(mine & (riders.status[:n] == AVAILABLE) & (regions != self.region)
+                                 & ((phase == PARKED) | (phase == CRUISING)))
+        for rider_id in leaving.tolist():
+            with riders.lock_for(rider_id):
+                if riders.owner[rider_id] == self.region and riders.status[rider_id] == AVAILABLE:
+                    riders.owner[rider_id] = regions[rider_id]
+                    self.handoffs += 1
+
+        # Reconcile the local index with the shared state
+        wanted = np.flatnonzero((riders.owner[:n] == self.region) & (riders.status[:n] == AVAILABLE))
+        indexed = index.ids()
+        for rider_id in np.setdiff1d(indexed, wanted).tolist():
+            index.remove(rider_id)
+        added = np.setdiff1d(wanted, indexed)
+        index.insert_many(added.tolist(), riders.x[added].tolist(), riders.y[added].tolist())
+
+        # Snapshot of neighbours' available riders near the border
+        x_low, y_low, x_high, y_high = self.bounds
+        band = self.border_band
+        xs, ys = riders.x[:n], riders.y[:n]
+        near = np.flatnonzero((riders.owner[:n] != self.region) & (riders.status[:n] == AVAILABLE)
+                              & (xs >= x_low - band) & (xs <= x_high + band)
+                              & (ys >= y_low - band) & (ys <= y_high + band))
+        self.remote = (near, xs[near].copy(), ys[near].copy())
+
+
+def run_shard(region, regions, config, store_args, reports, stop, duration=None, speed=None):
+    # Process entry point: one Scheduler and SimulationEngine for one region,
+    # reporting cumulative metrics and latency deltas after every sync interval
+    shards = regions[0] * regions[1]
+    x_low, y_low, x_high, y_high = region_bounds(region, regions)
+    config = dict(config,
+                  customer_count=max(1, math.ceil(config['customer_count'] / shards)),
+                  arrival_interval=tuple(v * shards for v in config['arrival_interval']))
+    # Each shard's streams derive from the run seed and its region
+    config['seed'] = [config['seed'], region] if isinstance(config['seed'], int) else list(config['seed']) + [region]
+    if config['trace_path']:  # One trace file per shard, with shard-local customer ids
+        config['trace_path'] = f"{config['trace_path']}.{region}"
+    scheduler = Scheduler(config)
+    scheduler.riders = SharedRiderStore(*store_args)
+    if scheduler.instruments:
+        scheduler.riders.locks = scheduler.instruments.watch('rider', scheduler.riders.locks)
+    shard = scheduler.shard = Shard(scheduler, region, regions)
+    customers = scheduler.customers
+    rng = scheduler.np_rng['customers']
+    customers.x[:customers.size] = rng.uniform(x_low, x_high, customers.size)
+    customers.y[:customers.size] = rng.uniform(y_low, y_high, customers.size)
+    if scheduler.demand:
+        demand = scheduler.demand
+        demand.rate = config['demand_rate'] / shards
+        demand.bounds = shard.bounds
+        demand.hotspots = [spot for spot in demand.hotspots
+                           if region_of(spot['center'][0], spot['center'][1], regions) == region]
+        if config['demand_seed'] is not None:
+            demand.seed = config['demand_seed'] + region
+        demand.reset()
+
+    engine = SimulationEngine(scheduler, speed)
+    interval = config['shard_sync_interval']
+    reported = {}
+    logged = -1  # Last event sequence number sent
+    try:
+        while not stop.is_set() and (duration is None or engine.now < duration):
+            shard.sync()
+            engine.run(interval if duration is None else min(interval, duration - engine.now))
+            counts = scheduler.latency.counts()
+            deltas = {key: value - reported[key] if key in reported else value for key, value in counts.items()}
+            reported = counts
+            events = scheduler.events.since(logged)
+            if events:
+                logged = events[-1][0]
+            reports.put({
+                'region': region,
+                'time': engine.now,
+                'metrics': dict(scheduler.metrics),
+                'rating_counts': list(scheduler.rating_counts),
+                'queue_depths': {task_type.name: q.qsize() for task_type, q in scheduler.queues.items()},
+                'latency': {key: delta for key, delta in deltas.items() if delta.any()},
+                'handoffs': shard.handoffs,
+                'events': events
+            })
+    finally:
+        if scheduler.trace:
+            scheduler.trace.close()
+        scheduler.riders.close()
+
+
+class ReportedQueue:
+    # Stand-in for a stage queue in the aggregated view: qsize() is the sum of
+    # the depths the shards last reported
+    def __init__(self):
+        self.depths = {}
+
+    def qsize(self):
+        return sum(self.depths.values())
+
+    def empty(self):
+        return not self.qsize()
+
+
+class ShardedScheduler:
+    # Splits the plane into `regions` (columns, rows), runs one Scheduler per
+    # region in its own process on top of a shared-memory fleet, and exposes
+    # the merged picture through the same attributes the dashboard reads from
+    # a Scheduler (riders, metrics, queues, latency, rating_counts, events).
+    def __init__(self, config=None, regions=(2, 2), capacity=100000):
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.config['seed'] = self.seed = seeding.resolve_seed(self.config['seed'])
+        self.rng, self.np_rng = seeding.streams(self.seed)
+        self.regions = regions
+        self.context = multiprocessing.get_context(self.config['shard_start_method'])
+        self.riders = SharedRiderStore(capacity, [self.context.Lock() for _ in range(LOCK_STRIPES)])
+        self.latency = LatencyRecorder(self.config['latency_window'])
+        # Shard customer ids are remapped to global ones (region blocks) on merge
+        self.customers_per_shard = max(1, math.ceil(self.config['customer_count'] / (regions[0] * regions[1])))
+        self.events = EventLog(self.config['log_capacity'], self.config['log_level'],
+                               lambda customer: CustomerStore.label_format.format(customer + 1),
+                               lambda rider: self.riders.name(rider))
+        self.queues = {task_type: ReportedQueue() for task_type in TaskType}
+        self.lock = threading.Lock()
+        self.snapshots = SnapshotPublisher(self, self.config['snapshot_interval'])
+        self.processes = []
+        self.collector = None
+        self.stop_event = None
+        self.running = False
+        self._clear()
+
+    def _clear(self):
+        self.metrics = empty_metrics()
+        self.rating_counts = [0] * 5
+        self.events.clear()
+        self.shard_reports = {}  # region -> last report
+        self.now = 0.0
+        self.latency.clear()
+        for task_queue in self.queues.values():
+            task_queue.depths = {}
+
+    def add_rider(self, rider_id=None):
+        location = tuple(self.np_rng['riders'].uniform(0, 100, 2))
+        index = self.riders.add(location, rider_id)
+        self.riders.owner[index] = region_of(*location, self.regions)
+        return index
+
+    def add_riders(self, count):
+        rng = self.np_rng['riders']
+        ids = self.riders.add_many(rng.uniform(0, 100, count), rng.uniform(0, 100, count))
+        self.riders.owner[ids.start:ids.stop] = region_of(self.riders.x[ids.start:ids.stop],
+                                                          self.riders.y[ids.start:ids.stop], self.regions)
+        return ids
+
+    def rider_rating(self, rider_id, default=0.0):
+        return float(self.riders.ratings([rider_id], self.config['rating_half_life'], default)[0])
+
+    def rider_ratings(self, default=0.0):
+        return self.riders.ratings(None, self.config['rating_half_life'], default)
+
+    def manifest(self, **extra):
+        return seeding.manifest(self.config, self.seed, riders=self.riders.size, regions=self.regions, **extra)
+
+    def snapshot(self):
+        return self.snapshots.get()
+
+    def fleet_snapshot(self):
+        return self.snapshots.get_fleet()
+
+    def queue_wait_percentiles(self, percentiles=(50, 95, 99)):
+        return self.latency.priority_percentiles(self.now, percentiles)
+
+    def reset(self):
+        # The shards must be gone first: they write the shared fleet and their
+        # next cumulative report would overwrite the cleared metrics
+        self.stop(wait=True)
+        with self.lock:
+            self._clear()
+            riders = self.riders
+            n = riders.size
+            riders.trips[:n] = 0
+            riders.clear_ratings()
+            riders.set_all('available')
+            riders.phase[:n] = PARKED
+            riders.passenger[:n] = -1
+            riders.owner[:n] = region_of(riders.x[:n], riders.y[:n], self.regions)
+            self.snapshots.invalidate()
+
+    def start(self, duration=None, speed=1.0):
+        # Starts one process per region; speed=None runs them unpaced. Any
+        # previous shards are stopped and joined first.
+        self.stop(wait=True)
+        self.stop_event = self.context.Event()
+        reports = self.context.Queue()
+        self.processes = [
+            self.context.Process(target=run_shard, name=f"shard-{region}", daemon=True,
+                                 args=(region, self.regions, self.config, self.riders.attach_args(),
+                                       reports, self.stop_event, duration, speed))
+            for region in range(self.regions[0] * self.regions[1])
+        ]
+        self.running = True
+        for process in self.processes:
+            process.start()
+        self.collector = threading.Thread(target=self._collect, args=(reports,), name='shard-reports', daemon=True)
+        self.collector.start()
+
+    def _collect(self, reports):
+        while True:
+            try:
+                report = reports.get(timeout=0.2)
+            except queue.Empty:
+                if not any(process.is_alive() for process in self.processes):
+                    break
+                continue
+            self._merge(report)
+        self.running = False
+
+    def _merge(self, report):
+        with self.lock:
+            region = report['region']
+            self.shard_reports[region] = report
+            self.now = max(self.now, report['time'])
+            reports = self.shard_reports.values()
+            self.metrics = {key: sum(r['metrics'][key] for r in reports) for key in self.metrics}
+            self.rating_counts = [sum(r['rating_counts'][i] for r in reports) for i in range(5)]
+            for task_type, task_queue in self.queues.items():
+                task_queue.depths[region] = report['queue_depths'][task_type.name]
+            for key, counts in report['latency'].items():
+                if isinstance(key, tuple):
+                    self.latency.merge(key[0], counts, report['time'], priority=key[1])
+                else:
+                    self.latency.merge(key, counts, report['time'])
+            offset = region * self.customers_per_shard
+            for _, time, kind, customer, rider, value, detail in report['events']:
+                self.events.emit(kind, time, customer + offset if customer >= 0 else customer, rider, value, detail)
+
+    def stop(self, wait=False):
+        if self.stop_event:
+            self.stop_event.set()
+        if wait:
+            for process in self.processes:
+                process.join()
+            if self.collector:
+                self.collector.join()
+        self.running = False
+
+    def run(self, duration):
+        # Headless run of `duration` virtual seconds per shard, unpaced
+        self.start(duration, speed=None)
+        for process in self.processes:
+            process.join()
+        self.collector.join()
+        return self.metrics
+
+    def close(self):
+        self.stop(wait=True)
+        self.riders.close(unlink=True)
@@ -0,0 +1,104 @@
+import threading, time
+from collections import namedtuple
+from types import MappingProxyType
+import numpy as np
+from fleet import AVAILABLE
+from latency import STAGES
+
+# Fixed-size summary of a scheduler: counters, queue depths, fleet status
+# counts, rating aggregates and latency percentiles, never per-rider data
+Snapshot = namedtuple('Snapshot', [
+    'version', 'time', 'metrics', 'queue_depths', 'riders_available', 'riders_busy',
+    'rating_counts', 'rating_mean', 'latency', 'window_latency', 'queue_waits', 'match_series'])
+
+# Per-rider columns for the fleet panels, as read-only array copies
+FleetSnapshot = namedtuple('FleetSnapshot', ['version', 'names', 'x', 'y', 'available', 'trips', 'ratings'])
+
+
+def _frozen(array):
+    array = np.array(array)
+    array.setflags(write=False)
+    return array
+
+
+class SnapshotPublisher:
+    # Publishes immutable, versioned views of a Scheduler (or ShardedScheduler)
+    # for any number of dashboard readers. A view is rebuilt at most once per
+    # `interval` wall seconds, by whichever reader finds it stale first; other
+    # readers meanwhile get the previous view without waiting. Reading a
+    # published view never touches the live scheduler, so it cannot tear.
+    def __init__(self, scheduler, interval=0.5):
+        self.scheduler = scheduler
+        self.interval = interval
+        self.lock = threading.Lock()  # Held by the one reader rebuilding
+        self.version = 0
+        self.summary = None
+        self.fleet = None
+        self._built_at = {'summary': -np.inf, 'fleet': -np.inf}
+        self._names = []  # Rider display names, extended as riders are added
+
+    def invalidate(self):
+        # Forces the next read to rebuild (e.g. after a reset)
+        self._built_at = {'summary': -np.inf, 'fleet': -np.inf}
+
+    def _read(self, kind, build):
+        current = getattr(self, kind)
+        if time.monotonic() - self._built_at[kind] < self.interval:
+            return current
+        # Only block when there is nothing to hand out yet
+        if not self.lock.acquire(blocking=current is None):
+            return current
+        try:
+            if time.monotonic() - self._built_at[kind] >= self.interval:
+                self.version += 1
+                setattr(self, kind, build(self.version))
+                self._built_at[kind] = time.monotonic()
+            return getattr(self, kind)
+        finally:
+            self.lock.release()
+
+    def get(self):
+        return self._read('summary', self._build_summary)
+
+    def get_fleet(self):
+        return self._read('fleet', self._build_fleet)
+
+    def _build_summary(self, version):
+        scheduler = self.scheduler
+        with scheduler.lock:
+            metrics = dict(scheduler.metrics)
+            rating_counts = tuple(scheduler.rating_counts)
+        riders = scheduler.riders
+        n = riders.size
+        available = int(np.count_nonzero(riders.status[:n] == AVAILABLE))
+        ratings = sum(rating_counts)
+        now = scheduler.runtime.time() if hasattr(scheduler, 'runtime') else scheduler.now
+        latency = scheduler.latency
+        return Snapshot(
+            version=version,
+            time=now,
+            metrics=MappingProxyType(metrics),
+            queue_depths=MappingProxyType({task_type: q.qsize() for task_type, q in scheduler.queues.items()}),
+            riders_available=available,
+            riders_busy=n - available,
+            rating_counts=rating_counts,
+            rating_mean=sum((stars + 1) * count for stars, count in enumerate(rating_counts)) / ratings if ratings else 0.0,
+            latency=MappingProxyType({stage: MappingProxyType(latency.percentiles(stage)) for stage in STAGES}),
+            window_latency=MappingProxyType({stage: MappingProxyType(latency.percentiles(stage, now)) for stage in STAGES}),
+            queue_waits=MappingProxyType({priority: MappingProxyType(waits)
+                                          for priority, waits in scheduler.queue_wait_percentiles().items()}),
+            match_series=tuple((t, MappingProxyType(values)) for t, values in list(latency.series['match'])))
+
+    def _build_fleet(self, version):
+        riders = self.scheduler.riders
+        n = riders.size
+        while len(self._names) < n:
+            self._names.append(riders.name(len(self._names)))
+        return FleetSnapshot(
+            version=version,
+            names=tuple(self._names[:n]),
+            x=_frozen(riders.x[:n]),
+            y=_frozen(riders.y[:n]),
+            available=_frozen(riders.status[:n] == AVAILABLE),
+            trips=_frozen(riders.trips[:n]),
+            ratings=_frozen(self.scheduler.rider_ratings()[:n]))
@@ -0,0 +1,235 @@
+import math, threading, heapq
+import numpy as np
+
+
+GROWTH_FACTOR = 4  # Point count growth that triggers re-sizing an adaptive grid
+
+
+class GridIndex:
+    # Uniform grid over the plane that only holds points eligible for matching.
+    # Lookups search ring by ring outward from the query cell, so their cost
+    # depends on the points per cell rather than on the total number of points.
+    # With cell_size=None the grid sizes its cells for about `per_cell` points
+    # each over an extent x extent plane, and rebuilds itself whenever the
+    # point count has grown GROWTH_FACTOR times since it was last sized.
+    #
+    # Item ids are small non-negative integers (rider ids). Coordinates live in
+    # arrays indexed by id and cells only hold id lists, so a million points
+    # cost well under two hundred bytes each.
+    def __init__(self, cell_size=None, extent=100.0, per_cell=2.0, capacity=64):
+        self.adaptive = cell_size is None
+        self.extent = extent
+        self.per_cell = per_cell
+        self.cell_size = extent if cell_size is None else cell_size
+        self.sized_for = 1  # Point count the adaptive cell size was derived from
+        self.cells = {}     # (cx, cy) -> [item_id]
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.present = np.zeros(capacity, dtype=bool)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, item_id):
+        return item_id < len(self.present) and bool(self.present[item_id])
+
+    def _cell(self, loc):
+        return (int(loc[0] // self.cell_size), int(loc[1] // self.cell_size))
+
+    def _ring(self, cx, cy, r):
+        if r == 0:
+            yield (cx, cy)
+            return
+        for x in range(cx - r, cx + r + 1):
+            yield (x, cy - r)
+            yield (x, cy + r)
+        for y in range(cy - r + 1, cy + r):
+            yield (cx - r, y)
+            yield (cx + r, y)
+
+    # Storage, called with the lock held
+
+    def _reserve(self, size):
+        if size <= len(self.present):
+            return
+        capacity = max(size, 2 * len(self.present))
+        for name in ('x', 'y', 'present'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def _discard(self, item_id):
+        if item_id >= len(self.present) or not self.present[item_id]:
+            return False
+        cell = self._cell((self.x[item_id], self.y[item_id]))
+        bucket = self.cells[cell]
+        bucket.remove(item_id)
+        if not bucket:
+            del self.cells[cell]
+        self.present[item_id] = False
+        self.count -= 1
+        return True
+
+    def _fill(self, item_ids):
+        # Adds already stored, not yet bucketed ids to their cells
+        cxs = (self.x[item_ids] // self.cell_size).astype(np.int64).tolist()
+        cys = (self.y[item_ids] // self.cell_size).astype(np.int64).tolist()
+        cells = self.cells
+        for item_id, cx, cy in zip(item_ids.tolist(), cxs, cys):
+            bucket = cells.get((cx, cy))
+            if bucket is None:
+                cells[(cx, cy)] = [item_id]
+            else:
+                bucket.append(item_id)
+
+    def _resize(self):
+        # Re-sizes an adaptive grid that has outgrown its cells and rebuckets
+        # every point; returns False if no resize was due. Amortised O(1) per insert.
+        if not self.adaptive or self.count <= GROWTH_FACTOR * self.sized_for:
+            return False
+        self.sized_for = self.count
+        self.cell_size = self.extent * math.sqrt(self.per_cell / self.sized_for)
+        self.cells = {}
+        self._fill(np.flatnonzero(self.present))
+        return True
+
+    # Updates
+
+    def insert(self, item_id, loc):
+        with self.lock:
+            self._discard(item_id)
+            self._reserve(item_id + 1)
+            self.x[item_id], self.y[item_id] = loc
+            self.present[item_id] = True
+            self.count += 1
+            if not self._resize():
+                self.cells.setdefault(self._cell(loc), []).append(item_id)
+
+    def insert_many(self, item_ids, xs, ys):
+        # Bulk insert under a single lock acquisition
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        if not len(item_ids):
+            return
+        with self.lock:
+            self._reserve(int(item_ids.max()) + 1)
+            for item_id in item_ids[self.present[item_ids]].tolist():
+                self._discard(item_id)
+            self.x[item_ids], self.y[item_ids] = xs, ys
+            self.present[item_ids] = True
+            self.count += len(item_ids)
+            if not self._resize():
+                self._fill(item_ids)
+
+    def move_many(self, item_ids, xs, ys):
+        # Updates the locations of items that are in the index; others are
+        # skipped, so a caller can pass moved ids without checking eligibility.
+        # Only items that change cells touch the buckets. Returns how many
+        # were moved.
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+        with self.lock:
+            known = item_ids < len(self.present)
+            known[known] = self.present[item_ids[known]]
+            item_ids, xs, ys = item_ids[known], xs[known], ys[known]
+            size = self.cell_size
+            old_cx, old_cy = self.x[item_ids] // size, self.y[item_ids] // size
+            changed = (old_cx != xs // size) | (old_cy != ys // size)
+            for item_id, cx, cy in zip(item_ids[changed].tolist(), old_cx[changed].astype(np.int64).tolist(),
+                                       old_cy[changed].astype(np.int64).tolist()):
+                bucket = self.cells[(cx, cy)]
+                bucket.remove(item_id)
+                if not bucket:
+                    del self.cells[(cx, cy)]
+            self.x[item_ids], self.y[item_ids] = xs, ys
+            self._fill(item_ids[changed])
+        return len(item_ids)
+
+    def remove(self, item_id):
+        with self.lock:
+            return self._discard(item_id)
+
+    def clear(self):
+        with self.lock:
+            self.cells = {}
+            self.present[:] = False
+            self.count = 0
+
+    def ids(self):
+        # Indexed item ids as an int64 array
+        with self.lock:
+            return np.flatnonzero(self.present)
+
+    # Lookups
+
+    def _rings(self, loc):
+        # Yields (lower_bound, [item_id]) ring by ring in non-decreasing lower
+        # bound, where lower_bound is the minimum distance from loc to any
+        # point in the ring
+        cx, cy = self._cell(loc)
+        cells = self.cells
+        ring = 0
+        while True:
+            if 8 * ring > len(cells):
+                # Sparse grid: walking the remaining occupied cells is
+                # cheaper than enumerating mostly empty rings.
+                remaining = {}
+                for (gx, gy), bucket in cells.items():
+                    r = max(abs(gx - cx), abs(gy - cy))
+                    if r >= ring:
+                        remaining.setdefault(r, []).extend(bucket)
+                for r in sorted(remaining):
+                    yield max(r - 1, 0) * self.cell_size, remaining[r]
+                return
+            ids = []
+            for cell in self._ring(cx, cy, ring):
+                bucket = cells.get(cell)
+                if bucket:
+                    ids.extend(bucket)
+            if ids:
+                yield max(ring - 1, 0) * self.cell_size, ids
+            ring += 1
+
+    def nearest(self, loc, max_radius=None):
+        # Returns (distance, [item_ids]) for every point tied at the minimum
+        # distance, or (inf, []) if nothing lies within max_radius.
+        limit = float('inf') if max_radius is None else max_radius
+        best, found = float('inf'), []
+        x, y = loc
+        with self.lock:
+            px, py = self.x.item, self.y.item  # Plain floats, much cheaper than array scalars
+            for lower_bound, ids in self._rings(loc):
+                if lower_bound > best or lower_bound > limit:
+                    break
+                for item_id in ids:
+                    distance = math.sqrt((x - px(item_id))**2 + (y - py(item_id))**2)
+                    if distance > limit:
+                        continue
+                    if distance < best:
+                        best, found = distance, [item_id]
+                    elif distance == best:
+                        found.append(item_id)
+        return best, found
+
+    def k_nearest(self, loc, k, max_radius=None):
+        # Returns up to k (distance, item_id) pairs within max_radius, closest first
+        limit = float('inf') if max_radius is None else max_radius
+        heap = []  # max-heap of the k closest so far, as (-distance, -item_id)
+        x, y = loc
+        with self.lock:
+            px, py = self.x.item, self.y.item
+            for lower_bound, ids in self._rings(loc):
+                if lower_bound > limit or (len(heap) == k and lower_bound > -heap[0][0]):
+                    break
+                for item_id in ids:
+                    distance = math.sqrt((x - px(item_id))**2 + (y - py(item_id))**2)
+                    if distance > limit:
+                        continue
+                    entry = (-distance, -item_id)
+                    if len(heap) < k:
+                        heapq.heappush(heap, entry)
+                    elif entry > heap[0]:
+                        heapq.heapreplace(heap, entry)
+        return sorted((-d, -item_id) for d, item_id in heap)
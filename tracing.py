@@ -0,0 +1,109 @@
+import os, sys, threading
+import numpy as np
+
+MAGIC = b'RSTRACE\x01'
+HEADER_SIZE = 16  # MAGIC, then the record size as little-endian uint32 and 4 reserved bytes
+
+# Record kinds; stage is a TaskType value for queue and drop records
+KINDS = ('reset', 'arrival', 'enqueue', 'dequeue', 'match', 'trip_start', 'trip_end',
+         'payment', 'feedback', 'dropped', 'shed')
+RESET, ARRIVAL, ENQUEUE, DEQUEUE, MATCH, TRIP_START, TRIP_END, PAYMENT, FEEDBACK, DROPPED, SHED = range(len(KINDS))
+KIND_CODES = {name: code for code, name in enumerate(KINDS)}
+
+# value holds the kind's measurement: queue wait on dequeue, response time on
+# match, seconds for trip_end/payment, stars for feedback. The reserved byte
+# pads the record to 24 bytes and is always written as zero, so equal runs
+# produce byte-identical files.
+TRACE_DTYPE = np.dtype({
+    'names': ['time', 'value', 'customer', 'rider', 'kind', 'stage', 'priority', 'reserved'],
+    'formats': ['<f8', '<f4', '<i4', '<i4', 'u1', 'u1', 'u1', 'u1'],
+    'itemsize': 24
+})
+
+
+class TraceWriter:
+    # Append-only binary trace of scheduler events as fixed 24-byte records.
+    # record() only appends a tuple to a list (atomic under the GIL), and the
+    # list is converted and written in one batch every `buffer_records`
+    # records or on flush(), so tracing costs the hot path almost nothing.
+    def __init__(self, path, buffer_records=65536):
+        self.path = path
+        self.buffer_records = buffer_records
+        self.pending = []
+        self.written = 0  # Records on disk
+        self.lock = threading.Lock()  # Serialises batch writes
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + np.array([TRACE_DTYPE.itemsize, 0], dtype='<u4').tobytes())
+
+    def record(self, kind, time, customer=-1, rider=-1, value=0.0, stage=0, priority=0):
+        self.pending.append((time, value, customer, rider, kind, stage, priority, 0))
+        if len(self.pending) >= self.buffer_records:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            batch, self.pending = self.pending, []
+            if batch:
+                self.file.write(np.array(batch, dtype=TRACE_DTYPE).tobytes())
+                self.written += len(batch)
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.file.close()
+
+
+def load(path):
+    # Read-only memory map of a trace as a structured array; nothing is parsed,
+    # so even very large traces open instantly. A torn final record is ignored.
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a trace file")
+    record_size = int(np.frombuffer(header[8:12], dtype='<u4')[0])
+    if record_size != TRACE_DTYPE.itemsize:
+        raise ValueError(f"{path} has {record_size}-byte records, expected {TRACE_DTYPE.itemsize}")
+    count = (os.path.getsize(path) - HEADER_SIZE) // record_size
+    if not count:
+        return np.empty(0, dtype=TRACE_DTYPE)
+    return np.memmap(path, dtype=TRACE_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+def runs(trace):
+    # Splits a trace at its reset records into one view per run
+    bounds = np.flatnonzero(trace['kind'] == RESET)
+    return [part for part in np.split(trace, bounds) if len(part)]
+
+
+def summarize(trace, chunk=16_000_000):
+    # {kind: {'count', 'mean', 'max'}} of the value column, computed over
+    # chunks so a memory-mapped trace never has to fit in memory at once
+    counts = np.zeros(len(KINDS), dtype=np.int64)
+    totals = np.zeros(len(KINDS))
+    peaks = np.full(len(KINDS), -np.inf)
+    for start in range(0, len(trace), chunk):
+        part = trace[start:start + chunk]
+        kinds, values = part['kind'], part['value'].astype(float)
+        counts += np.bincount(kinds, minlength=len(KINDS))
+        totals += np.bincount(kinds, weights=values, minlength=len(KINDS))
+        for code in np.flatnonzero(np.bincount(kinds, minlength=len(KINDS))):
+            peaks[code] = max(peaks[code], values[kinds == code].max())
+    return {name: {'count': int(counts[code]), 'mean': float(totals[code] / counts[code]), 'max': float(peaks[code])}
+            for code, name in enumerate(KINDS) if counts[code]}
+
+
+def values(trace, kind):
+    # Value column of every record of one kind, e.g. values(trace, 'match') for response times
+    return trace['value'][trace['kind'] == KIND_CODES[kind]]
+
+
+if __name__ == '__main__':
+    # python tracing.py <file>...: per-kind counts and values of each trace
+    for path in sys.argv[1:]:
+        trace = load(path)
+        print(f"{path}: {len(trace)} records")
+        for name, stats in summarize(trace).items():
+            print(f"  {name:<11} {stats['count']:>12} mean {stats['mean']:10.3f} max {stats['max']:10.3f}")
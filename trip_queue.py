@@ -0,0 +1,140 @@
+import threading, time, queue
+
+
+class TripQueue:
+    # Drop-in replacement for queue.PriorityQueue holding trip matching entries
+    # (priority, enqueued_at, seq, task). Ordering depends on `mode`:
+    #   'priority' - lowest priority number first, FIFO within a priority
+    #   'aging'    - a request gains `aging_rate` priority levels per second waited
+    #   'edf'      - earliest deadline first, deadline = enqueued_at + deadline_step * priority
+    # Aging and EDF keys only depend on enqueue time, so they never go stale and
+    # the heap stays O(log n).
+    def __init__(self, maxsize=0, mode='priority', aging_rate=0.1, deadline_step=5.0):
+        self.maxsize = maxsize
+        self.mode = mode
+        self.aging_rate = aging_rate
+        self.deadline_step = deadline_step
+        self.heap = []  # [key, entry]
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.not_full = threading.Condition(self.mutex)
+
+    def _key(self, entry):
+        priority, enqueued_at, seq, _ = entry
+        if self.mode == 'aging':
+            return (priority + self.aging_rate * enqueued_at, seq)
+        if self.mode == 'edf':
+            return (enqueued_at + self.deadline_step * priority, seq)
+        return (priority, enqueued_at, seq)
+
+    # Heap primitives, called with the mutex held
+
+    def _swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+
+    def _sift_up(self, i):
+        while i > 0:
+            parent = (i - 1) // 2
+            if self.heap[i][0] >= self.heap[parent][0]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i):
+        size = len(self.heap)
+        while True:
+            smallest, left = i, 2 * i + 1
+            for child in (left, left + 1):
+                if child < size and self.heap[child][0] < self.heap[smallest][0]:
+                    smallest = child
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
+
+    def _push(self, entry):
+        self.heap.append([self._key(entry), entry])
+        self._sift_up(len(self.heap) - 1)
+
+    def _remove_at(self, i):
+        last = len(self.heap) - 1
+        if i != last:
+            self._swap(i, last)
+        _, entry = self.heap.pop()
+        if i < len(self.heap):
+            self._sift_up(i)
+            self._sift_down(i)
+        self.not_full.notify()
+        return entry
+
+    # queue.Queue interface
+
+    def qsize(self):
+        with self.mutex:
+            return len(self.heap)
+
+    def empty(self):
+        with self.mutex:
+            return not self.heap
+
+    def full(self):
+        with self.mutex:
+            return 0 < self.maxsize <= len(self.heap)
+
+    def put(self, entry, block=True, timeout=None):
+        with self.not_full:
+            if 0 < self.maxsize <= len(self.heap):
+                if not block:
+                    raise queue.Full
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while 0 < self.maxsize <= len(self.heap):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise queue.Full
+                    self.not_full.wait(remaining)
+            self._push(entry)
+            self.not_empty.notify()
+
+    def put_nowait(self, entry):
+        self.put(entry, block=False)
+
+    def put_many(self, entries):
+        # Queues as many entries as fit under one lock acquisition; returns how
+        # many were queued (always a prefix of entries)
+        with self.mutex:
+            room = len(entries) if self.maxsize <= 0 else max(0, min(len(entries), self.maxsize - len(self.heap)))
+            for entry in entries[:room]:
+                self._push(entry)
+            self.not_empty.notify(room)
+            return room
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            if not self.heap:
+                if not block:
+                    raise queue.Empty
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while not self.heap:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise queue.Empty
+                    self.not_empty.wait(remaining)
+            return self._remove_at(0)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    # Overload shedding
+
+    def pop_worst(self, than_key_of=None):
+        # Removes and returns the entry that would be served last. With
+        # than_key_of, only does so if that entry ranks behind the given one.
+        with self.mutex:
+            if not self.heap:
+                return None
+            first_leaf = len(self.heap) // 2
+            worst = max(range(first_leaf, len(self.heap)), key=lambda i: self.heap[i][0])
+            if than_key_of is not None and self.heap[worst][0] <= self._key(than_key_of):
+                return None
+            return self._remove_at(worst)